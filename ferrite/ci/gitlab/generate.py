@@ -216,7 +216,7 @@ def make_graph(context: Context, components: Component, end_tasks: List[str]) ->
     graph = Graph(context)
 
     for task_name in end_tasks:
-        task = components.tasks()[task_name]
+        task = components.task(task_name)
         graph.add_task_with_deps(task)
 
     stage = min(graph.stages()) - 1
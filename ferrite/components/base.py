@@ -1,9 +1,10 @@
 from __future__ import annotations
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
 from pathlib import Path
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
+from ferrite.utils.scan import Scanner
 from ferrite.remote.base import Device
 
 
@@ -12,6 +13,14 @@ class Context:
     device: Optional[Device] = None
     capture: bool = False
     jobs: Optional[int] = None
+    # Compiler launcher for C/C++ builds (`ccache` or `sccache`)
+    compiler_cache: Optional[str] = None
+    # Directory to keep downloads (e.g. git mirrors) between builds in
+    cache_dir: Optional[Path] = None
+    # Compare sources by content instead of modification time and size when detecting changes
+    content_scan: bool = False
+    # Source scanners by their cache paths, kept between runs (e.g. by manage daemon) to avoid reloading the cache
+    scanners: Dict[Path, Scanner] = field(default_factory=dict)
 
 
 @dataclass
@@ -47,6 +56,10 @@ class Task:
     def artifacts(self) -> List[Artifact]:
         return []
 
+    # Paths the task reads its input from (used to detect source changes).
+    def source_paths(self) -> List[Path]:
+        return []
+
 
 class FinalTask(Task):
 
@@ -70,6 +83,9 @@ class TaskList(Task):
     def artifacts(self) -> List[Artifact]:
         return [art for task in self.tasks for art in task.artifacts()]
 
+    def source_paths(self) -> List[Path]:
+        return [path for task in self.tasks for path in task.source_paths()]
+
 
 class TaskWrapper(Task):
 
@@ -100,27 +116,115 @@ class TaskWrapper(Task):
         else:
             return []
 
+    def source_paths(self) -> List[Path]:
+        if self.inner is not None:
+            return self.inner.source_paths()
+        else:
+            return []
+
 
 class Component:
 
     def tasks(self) -> Dict[str, Task]:
         raise NotImplementedError()
 
-    def _update_names(self) -> None:
+    def task(self, name: str) -> Task:
+        return self.tasks()[name]
+
+    def _update_names(self, prefix: str = "") -> None:
         for task_name, task in self.tasks().items():
-            task._name = f"{task_name}"
+            task._name = f"{prefix}{task_name}"
 
 
 class ComponentGroup(Component):
+    # Caches are kept in slots, not in `__dict__`, because groups often return `self.__dict__` as components.
+    __slots__ = ("_tasks", "_names_prefix")
+    _tasks: Optional[Dict[str, Task]]
+    _names_prefix: Optional[str]
+
+    # Subclasses don't have to call `super().__init__()`, so the slots are initialized here.
+    def __new__(cls, *args: Any, **kwargs: Any) -> Any:
+        self = super().__new__(cls)
+        self._tasks = None
+        self._names_prefix = None
+        return self
 
     def components(self) -> Dict[str, Component | ComponentGroup]:
         raise NotImplementedError()
 
+    def _component_names(self) -> List[str]:
+        return list(self.components().keys())
+
+    def _constructed_components(self) -> Dict[str, Component | ComponentGroup]:
+        return self.components()
+
+    def component(self, name: str) -> Component:
+        return self.components()[name]
+
     def tasks(self) -> Dict[str, Task]:
+        # The tree doesn't change after construction, so the flat index is built only once.
+        if self._tasks is not None:
+            return self._tasks
+
         tasks: Dict[str, Task] = {}
-        for comp_name, comp in self.components().items():
-            for task_name, task in comp.tasks().items():
+        for comp_name in self._component_names():
+            for task_name, task in self.component(comp_name).tasks().items():
                 key = f"{comp_name}.{task_name}"
                 assert key not in tasks
                 tasks[key] = task
+        self._tasks = tasks
         return tasks
+
+    def task(self, name: str) -> Task:
+        if self._tasks is not None:
+            return self._tasks[name]
+
+        # Look up only the subtree the task belongs to
+        for comp_name in self._component_names():
+            prefix = f"{comp_name}."
+            if name.startswith(prefix):
+                try:
+                    return self.component(comp_name).task(name[len(prefix):])
+                except KeyError:
+                    continue
+        raise KeyError(name)
+
+    def _update_names(self, prefix: str = "") -> None:
+        self._names_prefix = prefix
+        for comp_name, comp in self._constructed_components().items():
+            comp._update_names(f"{prefix}{comp_name}.")
+
+
+class LazyComponentGroup(ComponentGroup):
+    __slots__ = ("_constructed",)
+    _constructed: Dict[str, Component | ComponentGroup]
+
+    def __new__(cls, *args: Any, **kwargs: Any) -> Any:
+        self = super().__new__(cls, *args, **kwargs)
+        self._constructed = {}
+        return self
+
+    def component_factories(self) -> Dict[str, Callable[[], Component | ComponentGroup]]:
+        raise NotImplementedError()
+
+    def _component_names(self) -> List[str]:
+        return list(self.component_factories().keys())
+
+    def _constructed_components(self) -> Dict[str, Component | ComponentGroup]:
+        return dict(self._constructed)
+
+    def component(self, name: str) -> Component:
+        try:
+            return self._constructed[name]
+        except KeyError:
+            pass
+
+        comp = self.component_factories()[name]()
+        self._constructed[name] = comp
+        # Subtree is constructed after names were assigned, so name its tasks now
+        if self._names_prefix is not None:
+            comp._update_names(f"{self._names_prefix}{name}.")
+        return comp
+
+    def components(self) -> Dict[str, Component | ComponentGroup]:
+        return {name: self.component(name) for name in self._component_names()}
@@ -1,13 +1,102 @@
 from __future__ import annotations
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
+import os
+import json
+import shutil
 from pathlib import Path
+from functools import lru_cache
 from dataclasses import dataclass, field
 
-from ferrite.utils.run import run
+from ferrite.utils.run import RunError, run, capture, jobs_args, active_jobserver
+from ferrite.utils.files import digest, file_digest, read_stamp, write_stamp
 from ferrite.components.base import Artifact, Component, Task, Context
 from ferrite.components.toolchain import CrossToolchain, Toolchain
 
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Compiler launcher (`ccache` or `sccache`).
+# Cache directory is shared between all build trees and toolchains, compilers are distinguished by the tools themselves.
+# It is placed in the ferrite cache directory (`Context.cache_dir`) if it is set, otherwise the tool's default is used.
+class CompilerCache:
+
+    TOOLS = ["ccache", "sccache"]
+
+    def __init__(self, tool: str, cache_dir: Optional[Path] = None) -> None:
+        assert tool in self.TOOLS
+        exe = shutil.which(tool)
+        if exe is None:
+            raise RuntimeError(f"Compiler cache '{tool}' is not found")
+        self.tool = tool
+        self.exe = exe
+        self.dir = cache_dir / tool if cache_dir is not None else None
+
+    @staticmethod
+    def from_context(ctx: Context) -> Optional[CompilerCache]:
+        if ctx.compiler_cache is None:
+            return None
+        return CompilerCache(ctx.compiler_cache, ctx.cache_dir)
+
+    def opts(self, langs: List[str] = ["C", "CXX"]) -> List[str]:
+        return [f"-DCMAKE_{lang}_COMPILER_LAUNCHER={self.exe}" for lang in langs]
+
+    def envs(self) -> Dict[str, str]:
+        if self.dir is None:
+            return {}
+        return {f"{self.tool.upper()}_DIR": str(self.dir)}
+
+    def _ccache_stats(self) -> Tuple[int, int]:
+        stats: Dict[str, int] = {}
+        for line in capture([self.exe, "--print-stats"], add_env=self.envs()).splitlines():
+            key, _, value = line.partition("\t")
+            if value.isdigit():
+                stats[key] = int(value)
+        hits = stats.get("direct_cache_hit", 0) + stats.get("preprocessed_cache_hit", 0)
+        return (hits, stats.get("cache_miss", 0))
+
+    def _sccache_stats(self) -> Tuple[int, int]:
+        stats = json.loads(capture([self.exe, "--show-stats", "--stats-format", "json"], add_env=self.envs()))["stats"]
+
+        def total(key: str) -> int:
+            return sum([int(v) for v in stats.get(key, {}).get("counts", {}).values()])
+
+        return (total("cache_hits"), total("cache_misses"))
+
+    @staticmethod
+    def summary(before: Tuple[int, int], after: Tuple[int, int]) -> str:
+        hits, misses = [a - b for b, a in zip(before, after)]
+        rate = 100.0 * hits / (hits + misses) if hits + misses > 0 else 0.0
+        return f"hits: {hits}, misses: {misses} ({rate:.0f}%)"
+
+    # Returns total number of cache hits and misses, or `None` if the tool cannot report them.
+    def stats(self) -> Optional[Tuple[int, int]]:
+        try:
+            if self.tool == "ccache":
+                return self._ccache_stats()
+            else:
+                return self._sccache_stats()
+        except (RunError, ValueError, KeyError, AttributeError) as e:
+            logger.debug(f"Cannot get {self.tool} statistics: {e}")
+            return None
+
+
+def _find_generator() -> Optional[str]:
+    if shutil.which("ninja") is not None:
+        return "Ninja"
+    # CMake default
+    return None
+
+
+@lru_cache(maxsize=None)
+def _ninja_version() -> Optional[Tuple[int, ...]]:
+    try:
+        return tuple([int(n) for n in capture(["ninja", "--version"]).split(".")[:2]])
+    except (RunError, OSError, ValueError):
+        return None
+
 
 @dataclass
 class Cmake(Component):
@@ -17,8 +106,9 @@ class Cmake(Component):
         owner: Cmake
 
         def run(self, ctx: Context) -> None:
-            self.owner.configure(capture=ctx.capture)
-            self.owner.build(jobs=ctx.jobs, capture=ctx.capture)
+            compiler_cache = CompilerCache.from_context(ctx)
+            self.owner.configure(capture=ctx.capture, compiler_cache=compiler_cache)
+            self.owner.build(jobs=ctx.jobs, capture=ctx.capture, compiler_cache=compiler_cache)
 
         def dependencies(self) -> List[Task]:
             deps: List[Task] = []
@@ -30,6 +120,9 @@ class Cmake(Component):
         def artifacts(self) -> List[Artifact]:
             return [Artifact(self.owner.build_dir)]
 
+        def source_paths(self) -> List[Path]:
+            return [self.owner.src_dir]
+
     src_dir: Path
     build_dir: Path
     toolchain: Toolchain
@@ -37,6 +130,8 @@ class Cmake(Component):
     opts: List[str] = field(default_factory=list)
     envs: Dict[str, str] = field(default_factory=dict)
     deps: List[Task] = field(default_factory=list)
+    # CMake generator, Ninja is preferred if available
+    generator: Optional[str] = field(default_factory=_find_generator)
 
     def __post_init__(self) -> None:
         self.build_task = self.BuildTask(self)
@@ -50,34 +145,132 @@ class Cmake(Component):
         assert all((len(ds) == 2 for ds in deflist))
         return {k: v for k, v in deflist}
 
-    def configure(self, capture: bool = False) -> None:
+    def _cmake_files(self) -> Dict[str, str]:
+        files = {}
+        for dirpath, dirnames, filenames in os.walk(self.src_dir):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for name in filenames:
+                if name == "CMakeLists.txt" or name.endswith(".cmake"):
+                    path = Path(dirpath, name)
+                    files[str(path.relative_to(self.src_dir))] = file_digest(path)
+        return files
+
+    def _toolchain_fingerprint(self) -> List[str]:
+        tc = self.toolchain
+        fp = [tc.name, str(tc.target)]
+        if isinstance(tc, CrossToolchain):
+            fp.append(str(tc.path))
+        return fp
+
+    # Everything the result of `cmake` configuration depends on.
+    def _configure_fingerprint(self) -> Dict[str, Any]:
+        return {
+            "src_dir": str(self.src_dir),
+            "opts": self.opts,
+            "envs": self.envs,
+            "generator": self.generator,
+            "toolchain": self._toolchain_fingerprint(),
+            "cmake_files": self._cmake_files(),
+        }
+
+    @property
+    def _configure_stamp_path(self) -> Path:
+        return self.build_dir / "configure.stamp"
+
+    def _cached_generator(self) -> Optional[str]:
+        try:
+            with open(self.build_dir / "CMakeCache.txt", "r") as f:
+                for line in f:
+                    if line.startswith("CMAKE_GENERATOR:"):
+                        return line.split("=", 1)[1].strip()
+        except FileNotFoundError:
+            pass
+        return None
+
+    # Removes CMake cache along with generator files (object files too). Other build outputs are kept.
+    def _reset_cache(self) -> None:
+        (self.build_dir / "CMakeCache.txt").unlink(missing_ok=True)
+        shutil.rmtree(self.build_dir / "CMakeFiles", ignore_errors=True)
+
+    # Called when existing build directory is going to be re-configured because its fingerprint is changed.
+    def _before_reconfigure(self) -> None:
+        pass
+
+    def configure(self, capture: bool = False, compiler_cache: Optional[CompilerCache] = None) -> None:
         self.create_build_dir()
+
+        opts = [*self.opts, *(compiler_cache.opts() if compiler_cache is not None else [])]
+        fingerprint = digest({**self._configure_fingerprint(), "opts": opts})
+        if (self.build_dir / "CMakeCache.txt").exists() and read_stamp(self._configure_stamp_path) == fingerprint:
+            logger.info(f"Configuration of '{self.build_dir}' is unchanged")
+            return
+
+        cached_generator = self._cached_generator()
+        if cached_generator is not None and cached_generator != (self.generator or "Unix Makefiles"):
+            # CMake refuses to switch generator of existing build directory
+            logger.info(f"Generator of '{self.build_dir}' is changed from '{cached_generator}', resetting CMake cache")
+            self._reset_cache()
+        elif cached_generator is not None:
+            self._before_reconfigure()
+
+        # Remove stamp in case of configuration failure
+        self._configure_stamp_path.unlink(missing_ok=True)
         run(
             [
                 "cmake",
-                *self.opts,
+                *(["-G", self.generator] if self.generator is not None else []),
+                *opts,
                 self.src_dir,
             ],
             cwd=self.build_dir,
             add_env=self.envs,
             quiet=capture,
         )
+        write_stamp(self._configure_stamp_path, fingerprint)
 
-    def build(self, jobs: Optional[int] = None, capture: bool = False, verbose: bool = False) -> None:
+    # Build tool options and environment to limit parallelism.
+    def _jobs(self, jobs: Optional[int]) -> Tuple[List[str], Dict[str, str]]:
+        server = active_jobserver()
+        if self.generator != "Ninja" or server is None:
+            return (jobs_args("--parallel", jobs), {})
+        version = _ninja_version()
+        if version is not None and version >= (1, 13):
+            # Ninja accepts only FIFO jobserver on POSIX
+            return ([], {"MAKEFLAGS": server.makeflags(fifo=True)})
+        # Older Ninja ignores jobserver, so at least its own parallelism is limited
+        return (["--parallel", str(jobs if jobs is not None else server.jobs)], {})
+
+    def build(
+        self,
+        jobs: Optional[int] = None,
+        capture: bool = False,
+        verbose: bool = False,
+        compiler_cache: Optional[CompilerCache] = None,
+    ) -> None:
+        stats_before = compiler_cache.stats() if compiler_cache is not None else None
+        jobs_opts, env = self._jobs(jobs)
+        if compiler_cache is not None:
+            env.update(compiler_cache.envs())
         run(
             [
                 "cmake",
                 "--build",
                 self.build_dir,
                 *["--target", self.target],
-                "--parallel",
-                *([str(jobs)] if jobs is not None else []),
+                *jobs_opts,
                 *(["--verbose"] if verbose else []),
             ],
             cwd=self.build_dir,
+            add_env=env,
             quiet=capture,
         )
 
+        if compiler_cache is not None and stats_before is not None:
+            stats_after = compiler_cache.stats()
+            if stats_after is not None:
+                # Counters are global, so concurrent builds are counted too
+                logger.info(f"{compiler_cache.tool} {compiler_cache.summary(stats_before, stats_after)} in '{self.build_dir}'")
+
     def tasks(self) -> Dict[str, Task]:
         return {"build": self.build_task}
 
@@ -6,10 +6,16 @@ from pathlib import Path
 from dataclasses import dataclass
 from ferrite.components.cmake import Cmake
 
+from ferrite.utils.files import sync_tree
+from ferrite.utils.stage import stage_tree
 from ferrite.components.base import Artifact, Component, Task, Context
 from ferrite.components.conan import CmakeRunnableWithConan
 from ferrite.components.toolchain import HostToolchain, Toolchain
 
+import logging
+
+logger = logging.getLogger(__name__)
+
 
 class Codegen(Component):
 
@@ -20,12 +26,25 @@ class Codegen(Component):
         generate: Callable[[Path], None]
 
         def run(self, ctx: Context) -> None:
-            self.generate(self.owner.gen_dir)
-            shutil.copytree(self.owner.assets_dir, self.owner.gen_dir, dirs_exist_ok=True)
+            staging_dir = self.owner.staging_dir
+            if staging_dir.exists():
+                shutil.rmtree(staging_dir)
+            staging_dir.mkdir(parents=True)
+            try:
+                self.generate(staging_dir)
+                stage_tree(self.owner.assets_dir, staging_dir)
+                # Unchanged files keep their modification time, so dependent builds are not triggered.
+                changed = sync_tree(staging_dir, self.owner.gen_dir)
+            finally:
+                shutil.rmtree(staging_dir)
+            logger.info(f"{len(changed)} file(s) changed in '{self.owner.gen_dir}'")
 
         def artifacts(self) -> List[Artifact]:
             return [Artifact(self.owner.gen_dir)]
 
+        def source_paths(self) -> List[Path]:
+            return [self.owner.assets_dir]
+
     def __init__(
         self,
         assets_dir: Path,
@@ -38,6 +57,7 @@ class Codegen(Component):
 
         self.assets_dir = assets_dir
         self.gen_dir = target_dir / self.prefix
+        self.staging_dir = target_dir / f".{self.prefix}_staging"
         self.build_dir = target_dir / f"{self.prefix}_{toolchain.name}"
         self.test_dir = target_dir / f"{self.prefix}_test"
 
@@ -88,6 +108,13 @@ class CodegenWithTest(Codegen):
         }
 
 
+def _generate_example(path: Path) -> None:
+    # Codegen depends on `numpy`, so it is imported only when the generation is run.
+    from ferrite.codegen.test import generate
+
+    generate(path)
+
+
 class CodegenExample(CodegenWithTest):
 
     def __init__(
@@ -96,13 +123,11 @@ class CodegenExample(CodegenWithTest):
         target_dir: Path,
         toolchain: HostToolchain,
     ):
-        from ferrite.codegen.test import generate
-
         super().__init__(
             source_dir / "codegen",
             source_dir,
             target_dir,
             toolchain,
             "codegen",
-            generate,
+            _generate_example,
         )
@@ -1,17 +1,20 @@
 from __future__ import annotations
-import shutil
-from typing import Dict, List, cast
+from typing import Dict, List, Optional, cast
 
 from pathlib import Path
 from dataclasses import dataclass
-import toml
-import pydantic
 
-from ferrite.utils.run import capture, run
+from ferrite.utils.run import run
+from ferrite.utils.cache import cached_capture
+from ferrite.utils.files import digest, read_stamp, write_stamp, write_if_changed
 from ferrite.components.base import Context
-from ferrite.components.cmake import Cmake, CmakeRunnable
+from ferrite.components.cmake import Cmake, CmakeRunnable, CompilerCache
 from ferrite.components.toolchain import Toolchain, HostToolchain, CrossToolchain
 
+import logging
+
+logger = logging.getLogger(__name__)
+
 
 @dataclass
 class Conanfile:
@@ -32,15 +35,14 @@ class Conanfile:
             f.write(self.dumps())
 
 
+class ConanfileConflictError(RuntimeError):
+    pass
+
+
 @dataclass
 class _ConanfileExtCollapsed:
     requires: Dict[str, str]
 
-    def update(self, other: _ConanfileExtCollapsed) -> None:
-        # TODO: Compare versions on collision
-        assert len(set(self.requires.keys()).intersection(set(other.requires.keys()))) == 0
-        self.requires.update(other.requires)
-
     def to_conanfile(self) -> Conanfile:
         return Conanfile(
             requires=[f"{k}/{v}" for k, v in self.requires.items()],
@@ -48,40 +50,54 @@ class _ConanfileExtCollapsed:
         )
 
 
-class _ConanfileExt(pydantic.BaseModel):
-
-    class Dependency(pydantic.BaseModel):
-        path: str
+def _dependency_path(base_dir: Path, path: str, vars: Dict[str, str]) -> Path:
+    for k, v in vars.items():
+        path = path.replace(f"${k}", v)
+    dep_path = Path(path)
+    if not dep_path.is_absolute():
+        dep_path = base_dir / dep_path
+    return dep_path.resolve()
 
-    requires: Dict[str, str] = {}
-    dependencies: List[_ConanfileExt.Dependency] = []
 
-    def to_collapsed_without_deps(self) -> _ConanfileExtCollapsed:
-        return _ConanfileExtCollapsed(requires=dict(self.requires))
-
-
-_ConanfileExt.update_forward_refs()
-
-
-def _read_conanfile_ext(base_dir: Path) -> _ConanfileExt:
-    path = base_dir / "conanfile.toml"
-    with open(path, "r") as f:
-        data = toml.load(f)
-    return _ConanfileExt.parse_obj(data)
+def _conflict_text(name: str, versions: Dict[str, List[Path]]) -> str:
+    sources = [f"{ver} (from {', '.join([str(path) for path in paths])})" for ver, paths in versions.items()]
+    return f"  {name}: {', '.join(sources)}"
 
 
+# Walks conanfiles dependency graph visiting each conanfile once.
+# Identical requirements from different conanfiles (e.g. diamond dependencies) are merged, different versions are reported.
 def _read_and_collapse_conanfile_ext(base_dir: Path, vars: Dict[str, str]) -> _ConanfileExtCollapsed:
-    raw = _read_conanfile_ext(base_dir)
-    collapsed = raw.to_collapsed_without_deps()
-    for dep in raw.dependencies:
-        tmp = dep.path
-        for k, v in vars.items():
-            tmp = tmp.replace(f"${k}", v)
-        dep_path = Path(tmp)
-        if not dep_path.is_absolute():
-            dep_path = (base_dir / dep_path).resolve()
-        collapsed.update(_read_and_collapse_conanfile_ext(dep_path, vars))
-    return collapsed
+    # Parsing dependencies (`toml` and `pydantic`) are imported only when conanfile is generated.
+    from ferrite.components.conanfile_ext import read_conanfile_ext
+
+    # Name -> version -> conanfiles requiring it, in order of visiting
+    requires: Dict[str, Dict[str, List[Path]]] = {}
+
+    visited = set()
+    stack = [base_dir.resolve()]
+    while len(stack) > 0:
+        dir = stack.pop()
+        if dir in visited:
+            continue
+        visited.add(dir)
+
+        raw = read_conanfile_ext(dir)
+        for name, version in raw.requires.items():
+            requires.setdefault(name, {}).setdefault(version, []).append(dir)
+
+        # Reversed to visit dependencies in the order they are listed
+        stack.extend(reversed([_dependency_path(dir, dep.path, vars) for dep in raw.dependencies]))
+
+    conflicts = {name: versions for name, versions in requires.items() if len(versions) > 1}
+    if len(conflicts) > 0:
+        raise ConanfileConflictError(
+            "\n".join([
+                f"Conflicting requirements in '{base_dir}' dependencies:",
+                *[_conflict_text(name, versions) for name, versions in conflicts.items()],
+            ])
+        )
+
+    return _ConanfileExtCollapsed(requires={name: next(iter(versions)) for name, versions in requires.items()})
 
 
 def make_conanfile(base_dir: Path, vars: Dict[str, str] = {}) -> Conanfile:
@@ -117,7 +133,7 @@ class ConanProfile:
         else:
             raise RuntimeError(f"Unsupported toolchain type '{type(tc).__name__}'")
 
-        ver = capture([f"{tc_prefix}gcc", "-dumpversion"]).split(".")
+        ver = cached_capture([f"{tc_prefix}gcc", "-dumpversion"]).split(".")
         version = ".".join(ver[:min(len(ver), 2)])
 
         content = [
@@ -153,27 +169,43 @@ class ConanProfile:
 @dataclass
 class CmakeWithConan(Cmake):
 
-    def configure(self, capture: bool = False) -> None:
-        self.create_build_dir()
-
-        profile_path = self.build_dir / "profile.conan"
-        ConanProfile(self.toolchain).save(profile_path)
-
-        conanfile_path = self.build_dir / "conanfile.txt"
+    def _conanfile(self) -> str:
         try:
-            # Try to find and copy already ready conanfile
-            shutil.copyfile(self.src_dir / "conanfile.txt", conanfile_path)
+            # Try to find already ready conanfile
+            with open(self.src_dir / "conanfile.txt", "r") as f:
+                return f.read()
         except FileNotFoundError:
             # Generate conanfile
-            make_conanfile(self.src_dir, self._defs).save(conanfile_path)
+            return make_conanfile(self.src_dir, self._defs).dumps()
 
-        run(
-            ["conan", "install", conanfile_path, "--profile", profile_path, "--build", "missing"],
-            cwd=self.build_dir,
-            quiet=capture,
-        )
+    def _conan_installed(self) -> bool:
+        return (self.build_dir / "conaninfo.txt").exists() and any(self.build_dir.glob("conanbuildinfo*"))
 
-        super().configure(capture=capture)
+    def configure(self, capture: bool = False, compiler_cache: Optional[CompilerCache] = None) -> None:
+        self.create_build_dir()
+
+        profile = ConanProfile(self.toolchain).generate()
+        conanfile = self._conanfile()
+
+        profile_path = self.build_dir / "profile.conan"
+        conanfile_path = self.build_dir / "conanfile.txt"
+        write_if_changed(profile_path, profile)
+        write_if_changed(conanfile_path, conanfile)
+
+        stamp_path = self.build_dir / "conan.stamp"
+        fingerprint = digest([profile, conanfile])
+        if self._conan_installed() and read_stamp(stamp_path) == fingerprint:
+            logger.info(f"Conan dependencies of '{self.build_dir}' are unchanged")
+        else:
+            stamp_path.unlink(missing_ok=True)
+            run(
+                ["conan", "install", conanfile_path, "--profile", profile_path, "--build", "missing"],
+                cwd=self.build_dir,
+                quiet=capture,
+            )
+            write_stamp(stamp_path, fingerprint)
+
+        super().configure(capture=capture, compiler_cache=compiler_cache)
 
 
 @dataclass
@@ -0,0 +1,40 @@
+from __future__ import annotations
+from typing import Dict, List, Tuple
+
+import os
+from pathlib import Path
+
+import toml
+import pydantic
+
+
+class ConanfileExt(pydantic.BaseModel):
+
+    class Dependency(pydantic.BaseModel):
+        path: str
+
+    requires: Dict[str, str] = {}
+    dependencies: List[ConanfileExt.Dependency] = []
+
+
+ConanfileExt.update_forward_refs()
+
+# Parsed conanfiles by path along with their modification time
+_cache: Dict[Path, Tuple[int, ConanfileExt]] = {}
+
+
+def read_conanfile_ext(base_dir: Path) -> ConanfileExt:
+    path = base_dir / "conanfile.toml"
+    mtime = os.stat(path).st_mtime_ns
+    try:
+        cached_mtime, cached = _cache[path]
+        if cached_mtime == mtime:
+            return cached
+    except KeyError:
+        pass
+
+    with open(path, "r") as f:
+        data = toml.load(f)
+    conanfile = ConanfileExt.parse_obj(data)
+    _cache[path] = (mtime, conanfile)
+    return conanfile
@@ -4,7 +4,7 @@ from typing import List
 import shutil
 from pathlib import Path
 
-from ferrite.utils.files import substitute
+from ferrite.utils.files import ConfigManifest
 from ferrite.components.base import Context, Task
 from ferrite.components.app import AppBase
 from ferrite.components.epics.epics_base import AbstractEpicsBase
@@ -49,21 +49,24 @@ class AbstractAppIoc(AbstractIoc):
                 lib_dir / self.app_lib_name,
             )
 
-        def _configure(self) -> None:
-            super()._configure()
+        def _prepare_source(self) -> None:
+            super()._prepare_source()
+            # IOC is linked with App library
+            self._store_app_lib()
+
+        def _configure(self, config: ConfigManifest) -> None:
+            super()._configure(config)
 
-            substitute(
+            config.substitute(
                 [
                     ("^\\s*#*(\\s*CORE_SRC\\s*=).*$", f"\\1 {self.core_src_dir}"),
                     ("^\\s*#*(\\s*APP_BASE_SRC\\s*=).*$", f"\\1 {self.app_base_src_dir}"),
                     ("^\\s*#*(\\s*APP_BUILD_DIR\\s*=).*$", f"\\1 {self.app_build_dir}"),
                     ("^\\s*#*(\\s*APP_ARCH\\s*=).*$", f"\\1 {self.owner.arch}"),
                 ],
-                self.build_dir / "configure/CONFIG_SITE.local",
+                "configure/CONFIG_SITE.local",
             )
 
-            self._store_app_lib()
-
         def run(self, ctx: Context) -> None:
             super().run(ctx)
 
@@ -5,11 +5,11 @@ from typing import Dict, List, ClassVar
 import os
 import shutil
 from pathlib import Path, PurePosixPath
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, asdict
 
-import pydantic
-
-from ferrite.utils.run import capture, run
+from ferrite.utils.run import capture, run, jobs_args
+from ferrite.utils.scan import Scanner
+from ferrite.utils.files import ConfigManifest, sync_sources
 from ferrite.components.base import Artifact, Component, Task, Context
 from ferrite.components.toolchain import Target, Toolchain
 
@@ -37,50 +37,44 @@ def epics_arch_by_target(target: Target) -> str:
     raise Exception(f"Unknown target for EPICS: {str(target)}")
 
 
-# Milliseconds from the start of the epoch
-def _tree_mod_time(path: Path) -> int:
-    max_time = 0.0
-    for dirpath, dirnames, filenames in os.walk(path):
-        max_time = max([
-            max_time,
-            os.path.getmtime(dirpath),
-            *[os.path.getmtime(os.path.join(dirpath, fn)) for fn in filenames],
-        ])
-    return int(1000 * max_time)
-
-
-class _BuildInfo(pydantic.BaseModel):
+@dataclass
+class _BuildInfo:
     build_dir: str
-    dep_mod_times: Dict[str, int]
+    dep_digests: Dict[str, str]
+    config_digest: str
 
     FILE_NAME: ClassVar[str] = "build_info.json"
 
     @staticmethod
-    def from_paths(base_dir: Path, dep_paths: List[Path]) -> _BuildInfo:
+    def from_paths(base_dir: Path, dep_paths: List[Path], scanner: Scanner, config: ConfigManifest) -> _BuildInfo:
         return _BuildInfo(
             build_dir=str(base_dir),
-            dep_mod_times={str(path): _tree_mod_time(path) for path in dep_paths},
+            dep_digests={str(path): scanner.digest(path) for path in dep_paths},
+            config_digest=config.digest(),
         )
 
     @staticmethod
     def load(base_dir: Path) -> _BuildInfo:
         path = base_dir / _BuildInfo.FILE_NAME
         with open(path, "r") as f:
-            return _BuildInfo.parse_obj(json.load(f))
+            data = json.load(f)
+        return _BuildInfo(
+            build_dir=str(data["build_dir"]),
+            # Info stored by older versions has no digests, so the project is rebuilt once
+            dep_digests={str(k): str(v) for k, v in data.get("dep_digests", {}).items()},
+            config_digest=str(data.get("config_digest", "")),
+        )
 
     def store(self, base_dir: Path) -> None:
         path = base_dir / _BuildInfo.FILE_NAME
         with open(path, "w") as f:
-            json.dump(self.dict(), f, indent=2, sort_keys=True)
+            json.dump(asdict(self), f, indent=2, sort_keys=True)
 
     def has_changed_since(self, other: _BuildInfo) -> bool:
-        if self.build_dir != other.build_dir:
+        if self.build_dir != other.build_dir or self.config_digest != other.config_digest:
             return True
-        for path, time in self.dep_mod_times.items():
-            try:
-                if time > other.dep_mod_times[path]:
-                    return True
-            except KeyError:
+        for path, digest in self.dep_digests.items():
+            if digest != other.dep_digests.get(path):
                 return True
         return False
 
@@ -92,6 +86,8 @@ class AbstractEpicsProject(Component):
         deps: List[Task]
         clean: bool = False
         cached: bool = False
+        # Sources are compared by content (see `Context.content_scan`)
+        content_scan: bool = False
 
         def __post_init__(self) -> None:
             self.src_dir = self.owner.src_path
@@ -105,17 +101,37 @@ class AbstractEpicsProject(Component):
         def _prepare_source(self) -> None:
             pass
 
-        def _configure(self) -> None:
+        # Collects configuration of the project in the build directory.
+        def _configure(self, config: ConfigManifest) -> None:
             raise NotImplementedError()
 
+        def _config(self) -> ConfigManifest:
+            config = ConfigManifest()
+            self._configure(config)
+            return config
+
         def _install(self) -> None:
             raise NotImplementedError()
 
         def _dep_paths(self) -> List[Path]:
             return []
 
+        def _scanner(self, ctx: Context) -> Scanner:
+            cache_path = self.build_dir.parent / f".{self.build_dir.name}.scan.json"
+            # In content mode touching sources without changing them (e.g. by `git checkout`) doesn't cause rebuild,
+            # but all files are hashed on the first scan and after they are touched.
+            content = self.content_scan or ctx.content_scan
+            scanner = ctx.scanners.get(cache_path)
+            if scanner is None or scanner.content != content:
+                scanner = Scanner(content=content, cache_path=cache_path)
+                ctx.scanners[cache_path] = scanner
+            return scanner
+
         def run(self, ctx: Context) -> None:
-            info = _BuildInfo.from_paths(self.build_dir, self._dep_paths())
+            config = self._config()
+            scanner = self._scanner(ctx)
+            info = _BuildInfo.from_paths(self.build_dir, self._dep_paths(), scanner, config)
+            scanner.store()
             try:
                 stored_info = _BuildInfo.load(self.build_dir)
             except FileNotFoundError:
@@ -139,23 +155,27 @@ class AbstractEpicsProject(Component):
 
             self._prepare_source()
 
-            shutil.copytree(
+            # Build outputs are kept and `make` rebuilds only what depends on changed sources
+            self.build_dir.mkdir(parents=True, exist_ok=True)
+            # Configured files are produced from sources by `config`
+            changed = sync_sources(
                 self.src_dir,
                 self.build_dir,
-                dirs_exist_ok=True,
-                ignore=shutil.ignore_patterns(".git"),
+                self.build_dir / "source_info.json",
+                ignore=[".git"],
+                exclude=config.paths(),
             )
+            logger.info(f"{len(changed)} source file(s) changed in {self.build_dir}")
 
             logger.info(f"Configure {self.build_dir}")
-            self._configure()
+            configured = config.apply(self.src_dir, self.build_dir)
+            logger.info(f"{len(configured)} configuration file(s) changed in {self.build_dir}")
 
             logger.info(f"Build {self.build_dir}")
+            # Some projects install their outputs during the build
+            self.install_dir.mkdir(exist_ok=True)
             run(
-                [
-                    "make",
-                    "--jobs",
-                    *([str(ctx.jobs)] if ctx.jobs is not None else []),
-                ],
+                ["make", *jobs_args("--jobs", ctx.jobs)],
                 cwd=self.build_dir,
                 quiet=ctx.capture,
             )
@@ -163,7 +183,6 @@ class AbstractEpicsProject(Component):
             info.store(self.build_dir)
 
             logger.info(f"Install {self.build_dir} to {self.install_dir}")
-            self.install_dir.mkdir(exist_ok=True)
             self._install()
 
         def dependencies(self) -> List[Task]:
@@ -175,6 +194,9 @@ class AbstractEpicsProject(Component):
                 Artifact(self.install_dir, cached=self.cached),
             ]
 
+        def source_paths(self) -> List[Path]:
+            return self._dep_paths()
+
     @dataclass
     class DeployTask(Task):
         deploy_path: PurePosixPath
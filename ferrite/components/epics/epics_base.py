@@ -1,20 +1,48 @@
 from __future__ import annotations
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 import shutil
 from pathlib import Path, PurePosixPath
 
-from ferrite.utils.files import substitute, allow_patterns
-from ferrite.components.base import Task
+from ferrite.utils.files import ConfigManifest, allow_patterns
+from ferrite.utils.stage import stage_tree
+from ferrite.components.base import Artifact, Context, Task
 from ferrite.components.git import RepoList, RepoSource
 from ferrite.components.toolchain import HostToolchain, CrossToolchain
-from ferrite.components.epics.base import AbstractEpicsProject
+from ferrite.components.epics.base import AbstractEpicsProject, epics_arch_by_target
 
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def _configure_cross_toolchain(config: ConfigManifest, host_arch: str, toolchain: CrossToolchain) -> None:
+    cross_arch = epics_arch_by_target(toolchain.target)
+    assert cross_arch != host_arch
+
+    if cross_arch == "linux-arm" and host_arch.endswith("-x86_64"):
+        host_arch = host_arch[:-3] # Trim '_64'
+
+    config.substitute(
+        [
+            ("^(\\s*GNU_TARGET\\s*=).*$", f"\\1 {str(toolchain.target)}"),
+            ("^(\\s*GNU_DIR\\s*=).*$", f"\\1 {toolchain.path}"),
+        ],
+        f"configure/os/CONFIG_SITE.{host_arch}.{cross_arch}",
+    )
+
+
+# Host scripts are also needed on the cross target
+def _install_cross_scripts(build_dir: Path, install_dir: Path, host_arch: str, cross_arch: str) -> None:
+    assert cross_arch != host_arch
+    stage_tree(
+        build_dir / "bin" / host_arch,
+        install_dir / "bin" / cross_arch,
+        symlinks=True,
+        ignore=allow_patterns("*.pl", "*.py"),
+    )
+
+
 class AbstractEpicsBase(AbstractEpicsProject):
 
     class BuildTask(AbstractEpicsProject.BuildTask):
@@ -22,7 +50,7 @@ class AbstractEpicsBase(AbstractEpicsProject):
         def __init__(self, deps: List[Task]):
             super().__init__(deps=deps, cached=True)
 
-        def _configure_common(self) -> None:
+        def _configure_common(self, config: ConfigManifest) -> None:
             defs = [
                 #("USR_CFLAGS", ""),
                 #("USR_CPPFLAGS", ""),
@@ -33,24 +61,24 @@ class AbstractEpicsBase(AbstractEpicsProject):
                 ("INSTALL_PERMISSIONS", "644"),
             ]
             rules = [(f"^(\\s*{k}\\s*=).*$", f"\\1 {v}") for k, v in defs]
-            logger.info(rules)
-            substitute(
-                rules,
-                self.build_dir / "configure/CONFIG_COMMON",
-            )
+            config.substitute(rules, "configure/CONFIG_COMMON")
 
-        def _configure_toolchain(self) -> None:
+        def _configure_toolchain(self, config: ConfigManifest) -> None:
             raise NotImplementedError()
 
-        def _configure_install(self) -> None:
-            substitute([
+        def _configure_install(self, config: ConfigManifest) -> None:
+            config.substitute([
                 ("^\\s*#*(\\s*INSTALL_LOCATION\\s*=).*$", f"\\1 {self.install_dir}"),
-            ], self.build_dir / "configure/CONFIG_SITE")
+            ], "configure/CONFIG_SITE")
 
-        def _configure(self) -> None:
-            self._configure_common()
-            self._configure_toolchain()
-            #self._configure_install() # Install is broken
+        def _configure(self, config: ConfigManifest) -> None:
+            self._configure_common(config)
+            self._configure_toolchain(config)
+            #self._configure_install(config) # Install is broken
+
+        # Build outputs of these archs are not installed
+        def _skip_archs(self) -> List[str]:
+            return []
 
         # Workaround for broken EPICS install
         def _install(self) -> None:
@@ -67,12 +95,11 @@ class AbstractEpicsBase(AbstractEpicsProject):
                 #"templates",
             ]
             for path in paths:
-                shutil.copytree(
+                stage_tree(
                     self.build_dir / path,
                     self.install_dir / path,
-                    dirs_exist_ok=True,
                     symlinks=True,
-                    ignore=shutil.ignore_patterns("O.*"),
+                    ignore=shutil.ignore_patterns("O.*", *self._skip_archs()),
                 )
 
     @property
@@ -92,10 +119,10 @@ class EpicsBaseHost(AbstractEpicsBase):
         def owner(self) -> EpicsBaseHost:
             return self._owner
 
-        def _configure_toolchain(self) -> None:
-            substitute(
+        def _configure_toolchain(self, config: ConfigManifest) -> None:
+            config.substitute(
                 [("^(\\s*CROSS_COMPILER_TARGET_ARCHS\\s*=).*$", "\\1")],
-                self.build_dir / "configure/CONFIG_SITE",
+                "configure/CONFIG_SITE",
             )
 
     def __init__(self, target_dir: Path, toolchain: HostToolchain):
@@ -148,42 +175,35 @@ class EpicsBaseCross(AbstractEpicsBase):
         def owner(self) -> EpicsBaseCross:
             return self._owner
 
-        def _configure_toolchain(self) -> None:
-            toolchain = self.owner.toolchain
-
-            host_arch = self.owner.host_base.arch
-            cross_arch = self.owner.arch
-            assert cross_arch != host_arch
-
-            if cross_arch == "linux-arm" and host_arch.endswith("-x86_64"):
-                host_arch = host_arch[:-3] # Trim '_64'
-
-            substitute(
-                [("^(\\s*CROSS_COMPILER_TARGET_ARCHS\\s*=).*$", f"\\1 {cross_arch}")],
-                self.build_dir / "configure/CONFIG_SITE",
-            )
-            substitute(
-                [
-                    ("^(\\s*GNU_TARGET\\s*=).*$", f"\\1 {str(toolchain.target)}"),
-                    ("^(\\s*GNU_DIR\\s*=).*$", f"\\1 {toolchain.path}"),
-                ],
-                self.build_dir / f"configure/os/CONFIG_SITE.{host_arch}.{cross_arch}",
+        def _configure_toolchain(self, config: ConfigManifest) -> None:
+            config.substitute(
+                [("^(\\s*CROSS_COMPILER_TARGET_ARCHS\\s*=).*$", f"\\1 {self.owner.arch}")],
+                "configure/CONFIG_SITE",
             )
+            _configure_cross_toolchain(config, self.owner.host_base.arch, self.owner.toolchain)
+
+        def _skip_archs(self) -> List[str]:
+            multiarch = self.owner.multiarch
+            if multiarch is None:
+                return []
+            return [arch for arch in multiarch.cross_archs if arch != self.owner.arch]
 
         def _install(self) -> None:
             super()._install()
+            _install_cross_scripts(self.build_dir, self.install_dir, self.owner.host_base.arch, self.owner.arch)
 
-            host_arch = self.owner.host_base.arch
-            cross_arch = self.owner.arch
-            assert cross_arch != host_arch
+        def run(self, ctx: Context) -> None:
+            if self.owner.multiarch is None:
+                super().run(ctx)
+                return
+            # Already built by multiarch base, only outputs for this arch are installed
+            logger.info(f"Install {self.build_dir} ({self.owner.arch}) to {self.install_dir}")
+            self._install()
 
-            shutil.copytree(
-                self.build_dir / "bin" / host_arch,
-                self.install_dir / "bin" / cross_arch,
-                dirs_exist_ok=True,
-                symlinks=True,
-                ignore=allow_patterns("*.pl", "*.py"),
-            )
+        def artifacts(self) -> List[Artifact]:
+            if self.owner.multiarch is None:
+                return super().artifacts()
+            return [Artifact(self.install_dir, cached=self.cached)]
 
     class DeployTask(AbstractEpicsProject.DeployTask):
 
@@ -204,7 +224,14 @@ class EpicsBaseCross(AbstractEpicsBase):
         def owner(self) -> EpicsBaseCross:
             return self._owner
 
-    def __init__(self, target_dir: Path, toolchain: CrossToolchain, host_base: EpicsBaseHost):
+    # If `multiarch` is set then the base is built as a part of it instead of building separately.
+    def __init__(
+        self,
+        target_dir: Path,
+        toolchain: CrossToolchain,
+        host_base: EpicsBaseHost,
+        multiarch: Optional[EpicsBaseMultiarch] = None,
+    ):
 
         self._toolchain = toolchain
 
@@ -215,16 +242,20 @@ class EpicsBaseCross(AbstractEpicsBase):
         )
 
         self.host_base = host_base
+        self.multiarch = multiarch
 
         self.deploy_path = PurePosixPath("/opt/epics_base")
 
-        self._build_task = self.BuildTask(
-            self,
-            deps=[
-                self.toolchain.download_task,
-                self.host_base.build_task,
-            ],
-        )
+        if self.multiarch is None:
+            build_deps = [self.toolchain.download_task, self.host_base.build_task]
+        else:
+            assert self.toolchain in self.multiarch.toolchains
+            assert self.multiarch.host_base is self.host_base
+            # Dependent IOCs are built against the shared build
+            self.build_path = self.multiarch.build_path
+            build_deps = [self.multiarch.build_task]
+
+        self._build_task = self.BuildTask(self, deps=build_deps)
         self.deploy_task = self.DeployTask(
             self,
             self.deploy_path,
@@ -244,3 +275,75 @@ class EpicsBaseCross(AbstractEpicsBase):
             "build": self.build_task,
             "deploy": self.deploy_task,
         }
+
+
+# EPICS base for host and several cross targets built by a single `make` run
+# (with all targets in `CROSS_COMPILER_TARGET_ARCHS`), so that the common part is built only once.
+# Per-target `EpicsBaseCross` components that refer to it install their outputs from the shared build.
+class EpicsBaseMultiarch(AbstractEpicsBase):
+
+    class BuildTask(AbstractEpicsBase.BuildTask):
+
+        def __init__(self, owner: EpicsBaseMultiarch, deps: List[Task]):
+            self._owner = owner
+            super().__init__(deps=deps)
+
+        @property
+        def owner(self) -> EpicsBaseMultiarch:
+            return self._owner
+
+        def _configure_toolchain(self, config: ConfigManifest) -> None:
+            config.substitute(
+                [("^(\\s*CROSS_COMPILER_TARGET_ARCHS\\s*=).*$", f"\\1 {' '.join(self.owner.cross_archs)}")],
+                "configure/CONFIG_SITE",
+            )
+            for toolchain in self.owner.toolchains:
+                _configure_cross_toolchain(config, self.owner.host_base.arch, toolchain)
+
+        # Outputs are installed by each `EpicsBaseCross` that refers to the build
+        def _install(self) -> None:
+            pass
+
+        def artifacts(self) -> List[Artifact]:
+            return [Artifact(self.build_dir, cached=self.cached)]
+
+    def __init__(self, target_dir: Path, toolchains: List[CrossToolchain], host_base: EpicsBaseHost):
+
+        assert len(toolchains) > 0
+        self.toolchains = toolchains
+        self.host_base = host_base
+
+        super().__init__(
+            target_dir,
+            host_base.build_path,
+            host_base.prefix,
+        )
+
+        self.build_path = target_dir / f"{self.prefix}_build_multiarch"
+        # Nothing is installed from the shared build
+        self.install_path = self.build_path
+
+        self._build_task = self.BuildTask(
+            self,
+            deps=[
+                *[toolchain.download_task for toolchain in self.toolchains],
+                self.host_base.build_task,
+            ],
+        )
+
+    @property
+    def cross_archs(self) -> List[str]:
+        return [epics_arch_by_target(toolchain.target) for toolchain in self.toolchains]
+
+    @property
+    def build_task(self) -> EpicsBaseMultiarch.BuildTask:
+        return self._build_task
+
+    @property
+    def toolchain(self) -> HostToolchain:
+        return self.host_base.toolchain
+
+    def tasks(self) -> Dict[str, Task]:
+        return {
+            "build": self.build_task,
+        }
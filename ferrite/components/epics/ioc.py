@@ -6,12 +6,14 @@ import re
 import time
 from pathlib import Path, PurePosixPath
 
-from ferrite.utils.files import substitute
+from ferrite.utils.files import ConfigManifest, sync_tree
+from ferrite.utils.stage import stage_tree
 from ferrite.components.base import Task, FinalTask, Context
 from ferrite.components.toolchain import HostToolchain, CrossToolchain
 from ferrite.components.epics.base import AbstractEpicsProject
 from ferrite.components.epics.epics_base import AbstractEpicsBase, EpicsBaseCross, EpicsBaseHost
 from ferrite.utils.epics.ioc_remote import IocRemoteRunner
+from ferrite.remote.base import StoreItem
 
 
 class AbstractIoc(AbstractEpicsProject):
@@ -24,7 +26,7 @@ class AbstractIoc(AbstractEpicsProject):
             deps: List[Task],
         ):
             self._owner = owner
-            super().__init__(deps=deps, clean=True)
+            super().__init__(deps=deps)
             self.epics_base_dir = self.owner.epics_base.build_path
 
         @property
@@ -32,33 +34,35 @@ class AbstractIoc(AbstractEpicsProject):
             return self._owner
 
         def _prepare_source(self) -> None:
+            # `make` installs databases again, so the ones removed from sources don't remain installed
+            shutil.rmtree(self.install_dir / "db", ignore_errors=True)
+
             if len(self.owner.ioc_dirs) == 1:
                 # There is no patches
                 return
 
-            for ioc_dirs in self.owner.ioc_dirs:
-                shutil.copytree(ioc_dirs, self.src_dir, dirs_exist_ok=True)
+            # Later dirs override files of former ones, unchanged files are not touched
+            sync_tree(self.owner.ioc_dirs, self.src_dir, ignore=[".git"])
 
         def _dep_paths(self) -> List[Path]:
             return self.owner.ioc_dirs
 
-        def _configure(self) -> None:
-            substitute(
+        def _configure(self, config: ConfigManifest) -> None:
+            config.substitute(
                 [("^\\s*#*(\\s*EPICS_BASE\\s*=).*$", f"\\1 {self.epics_base_dir}")],
-                self.build_dir / "configure/RELEASE",
+                "configure/RELEASE",
             )
-            substitute(
+            config.substitute(
                 [("^\\s*#*(\\s*INSTALL_LOCATION\\s*=).*$", f"\\1 {self.install_dir}")],
-                self.build_dir / "configure/CONFIG_SITE",
+                "configure/CONFIG_SITE",
             )
-            self.install_dir.mkdir(exist_ok=True)
 
         def _install(self) -> None:
-            shutil.copytree(
+            stage_tree(
                 self.build_dir / "iocBoot",
                 self.install_dir / "iocBoot",
-                dirs_exist_ok=True,
                 ignore=shutil.ignore_patterns("Makefile"),
+                prune=True,
             )
 
     def _build_deps(self) -> List[Task]:
@@ -124,11 +128,11 @@ class IocCross(AbstractIoc):
 
     class BuildTask(AbstractIoc.BuildTask):
 
-        def _configure(self) -> None:
-            super()._configure()
-            substitute(
+        def _configure(self, config: ConfigManifest) -> None:
+            super()._configure(config)
+            config.substitute(
                 [("^\\s*#*(\\s*CROSS_COMPILER_TARGET_ARCHS\\s*=).*$", f"\\1 {self.owner.arch}")],
-                self.build_dir / "configure/CONFIG_SITE",
+                "configure/CONFIG_SITE",
             )
 
     class DeployTask(AbstractEpicsProject.DeployTask):
@@ -151,6 +155,7 @@ class IocCross(AbstractIoc):
         def _post(self, ctx: Context) -> None:
             assert ctx.device is not None
             boot_dir = self.owner.install_path / "iocBoot"
+            env_files: List[StoreItem] = []
             for ioc_name in [path.name for path in boot_dir.iterdir()]:
                 ioc_dirs = boot_dir / ioc_name
                 if not ioc_dirs.is_dir():
@@ -162,7 +167,8 @@ class IocCross(AbstractIoc):
                     text = f.read()
                 text = re.sub(r'(epicsEnvSet\("TOP",)[^\n]+', f'\\1"{self.deploy_path}")', text)
                 text = re.sub(r'(epicsEnvSet\("EPICS_BASE",)[^\n]+', f'\\1"{self.epics_deploy_path}")', text)
-                ctx.device.store_mem(text, self.deploy_path / "iocBoot" / ioc_name / "envPaths")
+                env_files.append((text, self.deploy_path / "iocBoot" / ioc_name / "envPaths"))
+            ctx.device.store_batch(env_files)
 
     class RunTask(FinalTask):
 
@@ -2,32 +2,96 @@ from __future__ import annotations
 from typing import Dict, List, Optional
 
 import shutil
+import hashlib
 from pathlib import Path
 
 from dataclasses import dataclass
 from ferrite.utils.run import run, RunError
+from ferrite.utils.files import file_lock
 from ferrite.components.base import Artifact, Component, Task, Context
 
 import logging
 
 logger = logging.getLogger(__name__)
 
-
-def clone(path: Path, remote: str, branch: Optional[str] = None, clean: bool = False, quiet: bool = False) -> bool:
+_GIT_ENV = {"GIT_TERMINAL_PROMPT": "0"}
+
+# Default number of submodules fetched in parallel
+SUBMODULE_JOBS = 8
+
+
+def _mirror_path(mirror_dir: Path, remote: str) -> Path:
+    name = remote.rstrip("/").rsplit("/", 1)[-1].removesuffix(".git")
+    return mirror_dir / f"{name}-{hashlib.sha256(remote.encode('utf-8')).hexdigest()[:16]}.git"
+
+
+# Creates or updates local bare mirror of the remote. Returns `None` if the mirror is unavailable.
+def update_mirror(mirror_dir: Path, remote: str, quiet: bool = False) -> Optional[Path]:
+    path = _mirror_path(mirror_dir, remote)
+    mirror_dir.mkdir(parents=True, exist_ok=True)
+    # Mirror directory may be shared between concurrent builds
+    with file_lock(path.with_suffix(".lock")):
+        try:
+            if path.exists():
+                run(["git", "remote", "update", "--prune"], cwd=path, add_env=_GIT_ENV, quiet=quiet)
+            else:
+                tmp_path = path.with_suffix(".tmp")
+                if tmp_path.exists():
+                    shutil.rmtree(tmp_path)
+                run(["git", "clone", "--mirror", remote, tmp_path], add_env=_GIT_ENV, quiet=quiet)
+                tmp_path.rename(path)
+        except RunError as e:
+            logger.warning(f"Failed to update mirror of '{remote}': {e}")
+            return path if path.exists() else None
+    return path
+
+
+def clone(
+    path: Path,
+    remote: str,
+    branch: Optional[str] = None,
+    clean: bool = False,
+    quiet: bool = False,
+    mirror_dir: Optional[Path] = None,
+    jobs: Optional[int] = None,
+) -> bool:
     if path.exists():
         # FIXME: Pull if update available
         logger.info(f"Repo '{remote}' is cloned already")
         return False
+
+    reference: List[str | Path] = []
+    if mirror_dir is not None:
+        mirror = update_mirror(mirror_dir, remote, quiet=quiet)
+        if mirror is not None:
+            # Objects are taken from the mirror and then copied, so the clone does not depend on it
+            reference = ["--reference-if-able", mirror, "--dissociate"]
+
+    if clean:
+        # History is removed anyway
+        history = ["--depth", "1", "--shallow-submodules"]
+    else:
+        # Full history, file contents are fetched on demand
+        history = ["--filter=blob:none"]
+
     try:
         run(
-            ["git", "clone", remote, path.name],
+            [
+                "git",
+                "clone",
+                *history,
+                *(["--branch", branch] if branch else []),
+                "--recurse-submodules",
+                "--jobs",
+                str(jobs or SUBMODULE_JOBS),
+                *reference,
+                remote,
+                path.name,
+            ],
             cwd=path.parent,
-            add_env={"GIT_TERMINAL_PROMPT": "0"},
+            add_env=_GIT_ENV,
             quiet=quiet,
         )
-        if branch:
-            run(["git", "checkout", branch], cwd=path, quiet=quiet)
-        run(["git", "submodule", "update", "--init", "--recursive"], cwd=path, quiet=quiet)
     except RunError:
         if path.exists():
             shutil.rmtree(path)
@@ -58,7 +122,15 @@ class GitCloneTask(Task):
         last_error = None
         for source in self.sources:
             try:
-                clone(self.path, source.remote, source.branch, clean=True, quiet=ctx.capture)
+                clone(
+                    self.path,
+                    source.remote,
+                    source.branch,
+                    clean=True,
+                    quiet=ctx.capture,
+                    mirror_dir=(ctx.cache_dir / "git" if ctx.cache_dir is not None else None),
+                    jobs=ctx.jobs,
+                )
                 return
             except RunError as e:
                 last_error = e
@@ -1,10 +1,10 @@
 from __future__ import annotations
 from dataclasses import dataclass, field
-from typing import Dict, List
+from typing import Any, Dict, List
 
-import shutil
 from pathlib import Path
 
+from ferrite.utils.files import file_digest
 from ferrite.components.base import Artifact, Component, Task, Context, TaskWrapper
 from ferrite.components.cmake import Cmake
 from ferrite.components.toolchain import CrossToolchain
@@ -33,12 +33,26 @@ class McuBase(Cmake):
         def dependencies(self) -> List[Task]:
             return [self.owner.build_task]
 
-    def configure(self, capture: bool = False) -> None:
-        # Workaround to disable cmake caching (incremental build is broken anyway)
-        if self.build_dir.exists():
-            shutil.rmtree(self.build_dir)
+    @property
+    def toolchain_file(self) -> Path:
+        return self.freertos.path / "tools/cmake_toolchain_files/armgcc.cmake"
 
-        super().configure(capture=capture)
+    def _freertos_fingerprint(self) -> Dict[str, Any]:
+        # FreeRTOS is cloned without `.git`, so the checkout is identified by its sources and directory
+        stat = self.freertos.path.stat()
+        return {
+            "sources": [[source.remote, source.branch] for source in self.freertos.sources],
+            "checkout": [stat.st_ino, stat.st_mtime_ns],
+            "toolchain_file": file_digest(self.toolchain_file),
+        }
+
+    def _configure_fingerprint(self) -> Dict[str, Any]:
+        return {**super()._configure_fingerprint(), "freertos": self._freertos_fingerprint()}
+
+    def _before_reconfigure(self) -> None:
+        # Cached compiler settings from the previous toolchain file are discarded,
+        # object files are kept and rebuilt by the generator only if their flags are changed.
+        (self.build_dir / "CMakeCache.txt").unlink(missing_ok=True)
 
     def __init__(
         self,
@@ -54,6 +68,8 @@ class McuBase(Cmake):
         deps: List[Task] = [],
     ):
         toolchain = toolchain
+        # Used by `toolchain_file`
+        self.freertos = freertos
 
         super().__init__(
             src_dir,
@@ -61,7 +77,7 @@ class McuBase(Cmake):
             toolchain,
             target=target,
             opts=[
-                "-DCMAKE_TOOLCHAIN_FILE={}".format(freertos.path / "tools/cmake_toolchain_files/armgcc.cmake"),
+                "-DCMAKE_TOOLCHAIN_FILE={}".format(self.toolchain_file),
                 "-DCMAKE_BUILD_TYPE=Release",
                 *opts,
             ],
@@ -75,7 +91,6 @@ class McuBase(Cmake):
                 *deps,
             ],
         )
-        self.freertos = freertos
 
         self.deploy_task = self.DeployTask(self, deployer)
         self.deploy_and_reboot_task = TaskWrapper(RebootTask(), deps=[self.deploy_task])
@@ -1,12 +1,13 @@
 from __future__ import annotations
-from typing import Dict, List, overload
+from typing import IO, Dict, List, Optional, overload
 
 import shutil
 from pathlib import Path, PurePosixPath
 from dataclasses import dataclass
+from contextlib import ExitStack
 
-from ferrite.utils.run import capture
-from ferrite.utils.net import download_alt
+from ferrite.utils.cache import cached_capture
+from ferrite.utils.files import digest, file_lock
 from ferrite.components.base import Artifact, Component, Task, Context
 from ferrite.remote.base import Device
 
@@ -50,14 +51,25 @@ class Target:
 @dataclass
 class Toolchain(Component):
     name: str
-    target: Target
     cached: bool = False
 
+    @property
+    def target(self) -> Target:
+        raise NotImplementedError()
+
 
 class HostToolchain(Toolchain):
 
     def __init__(self) -> None:
-        super().__init__("host", Target.from_str(capture(["gcc", "-dumpmachine"])))
+        super().__init__("host")
+        self._target: Optional[Target] = None
+
+    # Host target is probed only when it is actually needed.
+    @property
+    def target(self) -> Target:
+        if self._target is None:
+            self._target = Target.from_str(cached_capture(["gcc", "-dumpmachine"]))
+        return self._target
 
     def tasks(self) -> Dict[str, Task]:
         return {}
@@ -72,7 +84,7 @@ class CrossToolchain(Toolchain):
             self.owner = owner
 
         def run(self, ctx: Context) -> None:
-            self.owner.download()
+            self.owner.download(cache_dir=ctx.cache_dir)
 
         def artifacts(self) -> List[Artifact]:
             return [Artifact(self.owner.path, cached=self.owner.cached)]
@@ -87,14 +99,25 @@ class CrossToolchain(Toolchain):
             assert ctx.device is not None
             self.owner.deploy(ctx.device)
 
-    def __init__(self, name: str, target: Target, target_dir: Path, dir_name: str, archive: str, urls: List[str]):
-        super().__init__(name, target, cached=True)
-
+    def __init__(
+        self,
+        name: str,
+        target: Target,
+        target_dir: Path,
+        dir_name: str,
+        archive: str,
+        urls: List[str],
+        sha256: Optional[str] = None,
+    ):
+        super().__init__(name, cached=True)
+
+        self._target = target
         self.target_dir = target_dir
 
         self.dir_name = dir_name
         self.archive = archive
         self.urls = urls
+        self.sha256 = sha256
 
         self.path = target_dir / f"toolchain_{self.dir_name}"
         self.deploy_path = PurePosixPath("/opt/toolchain")
@@ -102,31 +125,107 @@ class CrossToolchain(Toolchain):
         self.download_task = self.DownloadTask(self)
         self.deploy_task = self.DeployTask(self)
 
-    def download(self) -> bool:
-        if self.path.exists():
-            logger.info(f"Toolchain {self.archive} is already downloaded")
-            return False
-
-        tmp_dir = self.target_dir / "download"
-        tmp_dir.mkdir(exist_ok=True)
+    @property
+    def target(self) -> Target:
+        return self._target
 
-        archive_path = tmp_dir / self.archive
-        if not archive_path.exists():
-            logger.info(f"Loading toolchain {self.archive} ...")
-            download_alt(self.urls, archive_path)
-        else:
-            logger.info(f"Toolchain archive {self.archive} already exists")
+    # If `archive_path` is set then the downloaded archive is also stored there.
+    def _download_and_extract(self, dst_dir: Path, archive_path: Optional[Path] = None) -> None:
+        # `urllib` is slow to import and is not needed unless something is downloaded.
+        from ferrite.utils.net import HashingReader, open_alt
+        from ferrite.utils.archive import extract_stream
+        from ferrite.utils.progress import DownloadBar
 
-        logger.info(f"Extracting toolchain {self.archive} ...")
-        dir_path = tmp_dir / self.dir_name
+        src, size = open_alt(self.urls)
+        bar = DownloadBar(total_bytes=size or 0)
+        part_path: Optional[Path] = None
         try:
-            shutil.unpack_archive(archive_path, tmp_dir)
+            with src, ExitStack() as stack:
+                tee: Optional[IO[bytes]] = None
+                if archive_path is not None:
+                    part_path = archive_path.with_name(f"{archive_path.name}.part")
+                    tee = stack.enter_context(open(part_path, "wb"))
+                # Archive is unpacked while it is being downloaded and checked when the download is complete
+                reader = HashingReader(src, tee=tee, on_read=bar.update_and_print)
+                extract_stream(reader, self.archive, dst_dir)
+                reader.verify(self.sha256)
+            if archive_path is not None and part_path is not None:
+                part_path.replace(archive_path)
         except:
-            if dir_path.exists():
-                shutil.rmtree(dir_path)
+            if part_path is not None:
+                part_path.unlink(missing_ok=True)
             raise
+        finally:
+            print(flush=True)
+
+    def _extract_cached(self, archive_path: Path, dst_dir: Path) -> None:
+        from ferrite.utils.net import ChecksumError, HashingReader
+        from ferrite.utils.archive import extract_stream
+
+        with open(archive_path, "rb") as f:
+            reader = HashingReader(f)
+            extract_stream(reader, self.archive, dst_dir)
+            try:
+                reader.verify(self.sha256)
+            except ChecksumError:
+                archive_path.unlink()
+                raise
+
+    def _install(self, dst_path: Path, archive_path: Optional[Path] = None) -> None:
+        # Extract to temporary directory first, so that incomplete toolchain never appears at `dst_path`
+        tmp_dir = dst_path.with_name(f".{dst_path.name}.tmp")
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        tmp_dir.mkdir(parents=True)
+        try:
+            if archive_path is None or not archive_path.exists():
+                # Archive is stored to the cache (if any) while it is being extracted
+                logger.info(f"Loading and extracting toolchain {self.archive} ...")
+                self._download_and_extract(tmp_dir, archive_path)
+            else:
+                logger.info(f"Extracting toolchain {self.archive} ...")
+                self._extract_cached(archive_path, tmp_dir)
+
+            dir_path = tmp_dir / self.dir_name
+            if not dir_path.is_dir():
+                raise RuntimeError(f"Toolchain archive {self.archive} does not contain '{self.dir_name}' directory")
+            dir_path.rename(dst_path)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    # Toolchains in the store are distinguished by both archive name and its checksum.
+    def _store_path(self, cache_dir: Path) -> Path:
+        return cache_dir / "toolchains" / "store" / f"{self.dir_name}-{digest([self.archive, self.sha256])[:16]}"
+
+    def _link(self, store_path: Path) -> None:
+        self.target_dir.mkdir(parents=True, exist_ok=True)
+        link_path = self.path.with_name(f".{self.path.name}.link")
+        link_path.unlink(missing_ok=True)
+        link_path.symlink_to(store_path, target_is_directory=True)
+        # Replaces dangling link (e.g. if the store was cleaned) atomically
+        link_path.replace(self.path)
+
+    # If `cache_dir` is set then the toolchain is installed to the store in it (shared between all projects)
+    # and `self.path` is a link to the store. The archive is kept in `cache_dir` too.
+    def download(self, cache_dir: Optional[Path] = None) -> bool:
+        if self.path.exists():
+            logger.info(f"Toolchain {self.archive} is already downloaded")
+            return False
 
-        shutil.move(dir_path, self.path)
+        if cache_dir is None:
+            self.target_dir.mkdir(parents=True, exist_ok=True)
+            self._install(self.path)
+            return True
+
+        store_path = self._store_path(cache_dir)
+        store_path.parent.mkdir(parents=True, exist_ok=True)
+        # Concurrent builds wait for the one installing the toolchain
+        with file_lock(store_path.with_name(f"{store_path.name}.lock")):
+            if store_path.exists():
+                logger.info(f"Toolchain {self.archive} is found in store '{store_path}'")
+            else:
+                self._install(store_path, cache_dir / "toolchains" / self.archive)
+        self._link(store_path)
 
         return True
 
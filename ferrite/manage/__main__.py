@@ -1,17 +1,30 @@
 from __future__ import annotations
+from typing import Dict, List
 
+import sys
 import argparse
 from pathlib import Path
 
-from ferrite.manage.tree import make_components
-import ferrite.manage.cli as cli
-
-import logging
+import ferrite.manage.daemon as daemon
 
 if __name__ == "__main__":
     base_dir = Path.cwd()
     target_dir = base_dir / "target"
     target_dir.mkdir(exist_ok=True)
+    socket_path = target_dir / "manage.sock"
+
+    # Forward to the running daemon before anything heavy is done
+    argv = sys.argv[1:]
+    # (watching keeps its state in its own process)
+    if all([arg not in argv for arg in ["--daemon", "--no-daemon", "--watch"]]):
+        status = daemon.request(socket_path, argv)
+        if status is not None:
+            exit(status)
+
+    from ferrite.utils.scan import Scanner
+    from ferrite.remote.base import Device
+    from ferrite.manage.tree import make_components
+    import ferrite.manage.cli as cli
 
     components = make_components(base_dir, target_dir)
 
@@ -21,13 +34,31 @@ if __name__ == "__main__":
     )
     cli.add_parser_args(parser, components)
 
-    args = parser.parse_args()
+    devices: Dict[str, Device] = {}
+    # Daemon keeps file fingerprints in memory between runs
+    scanners: Dict[Path, Scanner] = {}
 
-    try:
-        params = cli.read_run_params(args, components)
-    except cli.ReadRunParamsError as e:
-        print(e)
-        exit(1)
+    def run(argv: List[str]) -> int:
+        args = parser.parse_args(argv)
 
-    cli.setup_logging(params)
-    cli.run_with_params(params)
+        try:
+            params = cli.read_run_params(args, components, state_dir=target_dir, devices=devices, scanners=scanners)
+        except cli.ReadRunParamsError as e:
+            print(e)
+            return 1
+
+        cli.setup_logging(params)
+        cli.run_with_params(params)
+        return 0
+
+    status = 0
+    try:
+        if parser.parse_args(argv).daemon:
+            daemon.serve(socket_path, run)
+        else:
+            status = run(argv)
+    finally:
+        # Daemon keeps device connections between runs
+        for device in devices.values():
+            device.close()
+    exit(status)
@@ -1,12 +1,22 @@
 from __future__ import annotations
-from typing import Dict, List, Optional
+from typing import ContextManager, Dict, List, Optional, Type
 
+import os
 import argparse
+import threading
+from pathlib import Path
 from dataclasses import dataclass
+from contextlib import nullcontext
 from colorama import init as colorama_init, Fore, Style
 
 from ferrite.components.base import Context, Task, Component
+from ferrite.components.cmake import CompilerCache
+from ferrite.remote.base import Device
 from ferrite.remote.ssh import SshDevice
+from ferrite.utils.run import jobserver, log_output
+from ferrite.utils.scan import Scanner
+from ferrite.manage.schedule import Schedule, TaskHistory
+from ferrite.manage.watch import Watcher
 
 import logging
 
@@ -48,17 +58,29 @@ def _available_tasks_text(comp: Component) -> str:
     ])
 
 
+def _make_help_formatter(comp: Component) -> Type[argparse.HelpFormatter]:
+
+    # Builds the list of available tasks only when help is actually printed.
+    class HelpFormatter(argparse.RawTextHelpFormatter):
+
+        def _get_help_string(self, action: argparse.Action) -> Optional[str]:
+            text = super()._get_help_string(action)
+            if action.dest == "task" and text is not None:
+                text = "\n".join([text, _available_tasks_text(comp).replace("%", "%%")])
+            return text
+
+    return HelpFormatter
+
+
 def add_parser_args(parser: argparse.ArgumentParser, comp: Component) -> None:
-    parser.formatter_class = argparse.RawTextHelpFormatter
+    parser.formatter_class = _make_help_formatter(comp)
 
     parser.add_argument(
         "task",
         type=str,
+        nargs="?",
         metavar="<task>",
-        help="\n".join([
-            "Task you want to run.",
-            _available_tasks_text(comp),
-        ]),
+        help="Task you want to run.",
     )
     parser.add_argument(
         "--no-deps",
@@ -88,7 +110,63 @@ def add_parser_args(parser: argparse.ArgumentParser, comp: Component) -> None:
         type=int,
         metavar="<N>",
         default=None,
-        help="Number of parallel process to build. By default automatically determined value is used.",
+        help="\n".join([
+            "Number of parallel process to build. By default the number of CPUs is used.",
+            "The limit is shared between all running tasks via GNU make jobserver.",
+        ]),
+    )
+    parser.add_argument(
+        "--compiler-cache",
+        type=str,
+        choices=CompilerCache.TOOLS,
+        default=None,
+        help="Use compiler cache for C/C++ builds. Cache is shared between all build directories.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        metavar="<path>",
+        default=None,
+        help="\n".join([
+            "Directory to keep downloads in between builds (e.g. git mirrors), may be shared between several checkouts.",
+            "By default 'FERRITE_CACHE_DIR' environment variable is used if set.",
+        ]),
+    )
+    parser.add_argument(
+        "--content-scan",
+        action="store_true",
+        help="\n".join([
+            "Compare sources by content instead of modification time when checking whether a project should be rebuilt.",
+            "Touched but unchanged files (e.g. after 'git checkout') don't cause rebuild, but changed files are hashed.",
+        ]),
+    )
+    parser.add_argument(
+        "--parallel",
+        type=int,
+        metavar="<N>",
+        default=1,
+        help="Number of independent tasks to run concurrently. Tasks on the longest critical path are started first.",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="\n".join([
+            "Watch task sources and re-run the tasks whose sources changed along with their dependents.",
+            "Press Ctrl+C to stop watching.",
+        ]),
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="\n".join([
+            "Start manage daemon that keeps components and device connections between runs.",
+            "While it is running, other invocations are forwarded to it.",
+        ]),
+    )
+    parser.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="Run in this process even if manage daemon is running.",
     )
 
 
@@ -101,40 +179,93 @@ class RunParams:
     task: Task
     context: Context
     no_deps: bool = False
+    parallel: int = 1
+    watch: bool = False
+    # Directory to keep state between runs in (e.g. task durations history)
+    state_dir: Optional[Path] = None
+    # Device connections are kept open after the run (device is owned by the caller)
+    keep_device: bool = False
 
 
 def _find_task_by_args(comp: Component, args: argparse.Namespace) -> Task:
     task_name = args.task
+    if task_name is None:
+        raise ReadRunParamsError("\n".join(["Task is not specified.", _available_tasks_text(comp)]))
     try:
-        task = comp.tasks()[task_name]
+        task = comp.task(task_name)
     except KeyError:
         raise ReadRunParamsError("\n".join([f"Unknown task '{task_name}'.", _available_tasks_text(comp)]))
 
     return task
 
 
-def _make_context_from_args(args: argparse.Namespace) -> Context:
-    device = None
+def _cache_dir_from_args(args: argparse.Namespace) -> Optional[Path]:
+    if args.cache_dir is not None:
+        return Path(args.cache_dir).resolve()
+    path = os.environ.get("FERRITE_CACHE_DIR")
+    return Path(path) if path else None
+
+
+def _make_context_from_args(
+    args: argparse.Namespace,
+    devices: Optional[Dict[str, Device]] = None,
+    scanners: Optional[Dict[Path, Scanner]] = None,
+) -> Context:
+    device: Optional[Device] = None
     if args.device:
-        device = SshDevice(args.device)
+        # Reuse device (and its connections) from previous runs
+        device = devices.get(args.device) if devices is not None else None
+        if device is None:
+            device = SshDevice(args.device)
+            if devices is not None:
+                devices[args.device] = device
 
     return Context(
         device=device,
         capture=not args.no_capture,
         jobs=args.jobs,
+        compiler_cache=args.compiler_cache,
+        cache_dir=_cache_dir_from_args(args),
+        content_scan=args.content_scan,
+        scanners=scanners if scanners is not None else {},
     )
 
 
-def read_run_params(args: argparse.Namespace, comp: Component) -> RunParams:
+def read_run_params(
+    args: argparse.Namespace,
+    comp: Component,
+    state_dir: Optional[Path] = None,
+    devices: Optional[Dict[str, Device]] = None,
+    scanners: Optional[Dict[Path, Scanner]] = None,
+) -> RunParams:
     try:
         task = _find_task_by_args(comp, args)
     except ReadRunParamsError as e:
         print(e)
         exit(1)
 
-    context = _make_context_from_args(args)
+    if args.parallel < 1:
+        print(f"Number of parallel tasks must be positive, got {args.parallel}")
+        exit(1)
 
-    return RunParams(task, context, no_deps=args.no_deps)
+    if args.compiler_cache is not None:
+        try:
+            CompilerCache(args.compiler_cache)
+        except RuntimeError as e:
+            print(e)
+            exit(1)
+
+    context = _make_context_from_args(args, devices, scanners)
+
+    return RunParams(
+        task,
+        context,
+        no_deps=args.no_deps,
+        parallel=args.parallel,
+        watch=args.watch,
+        state_dir=state_dir,
+        keep_device=(devices is not None),
+    )
 
 
 def _prepare_for_run(params: RunParams) -> None:
@@ -148,42 +279,85 @@ def setup_logging(params: RunParams, modules: List[str] = ["ferrite"]) -> None:
             logging.getLogger(mod).setLevel(logging.DEBUG)
 
 
+_print_lock = threading.Lock()
+
+
 def _print_title(text: str, style: Optional[str] = None, end: bool = True) -> None:
     if style is not None:
         text = style + text + Style.RESET_ALL
-    print(text, flush=True, end=("" if not end else None))
+    with _print_lock:
+        print(text, flush=True, end=("" if not end else None))
 
 
-def _run_task(context: Context, task: Task, complete_tasks: Dict[str, Task], no_deps: bool = False) -> None:
-    if task.name() in complete_tasks:
-        return
+def _run_task(context: Context, task: Task, parallel: bool = False, log_dir: Optional[Path] = None) -> None:
+    # Concurrent tasks cannot share a line, so the status is printed on completion only
+    inline = context.capture and not parallel
 
-    if not no_deps:
-        for dep in task.dependencies():
-            _run_task(context, dep, complete_tasks, no_deps=no_deps)
+    # Captured output of each task is written to its own log
+    log: ContextManager[Optional[Path]] = nullcontext()
+    if log_dir is not None and context.capture:
+        log = log_output(log_dir / f"{task.name().replace(os.sep, '_')}.log")
 
-    if context.capture:
+    if inline:
         _print_title(f"{task.name()} ... ", end=False)
-    else:
+    elif not context.capture:
         _print_title(f"\nTask '{task.name()}' started ...", Style.BRIGHT)
 
     try:
-        task.run(context)
+        with log:
+            task.run(context)
     except:
-        if context.capture:
+        if inline:
             _print_title(f"FAIL", Fore.RED)
+        elif context.capture:
+            _print_title(f"{task.name()} ... " + Fore.RED + "FAIL")
         else:
             _print_title(f"Task '{task.name()}' FAILED:", Style.BRIGHT + Fore.RED)
         raise
     else:
-        if context.capture:
+        if inline:
             _print_title(f"ok", Fore.GREEN)
+        elif context.capture:
+            _print_title(f"{task.name()} ... " + Fore.GREEN + "ok")
         else:
             _print_title(f"Task '{task.name()}' successfully completed", Style.BRIGHT + Fore.GREEN)
 
-    complete_tasks[task.name()] = task
+
+def _task_history(params: RunParams) -> TaskHistory:
+    if params.state_dir is None:
+        return TaskHistory()
+    return TaskHistory(params.state_dir / "task_durations.json")
 
 
 def run_with_params(params: RunParams) -> None:
     _prepare_for_run(params)
-    _run_task(params.context, params.task, {}, no_deps=params.no_deps)
+
+    schedule = Schedule(params.task, _task_history(params), no_deps=params.no_deps)
+    estimate = schedule.estimate()
+    if len(estimate.unknown) < len(schedule.nodes):
+        _print_title(estimate.text(), Style.DIM)
+
+    parallel = params.parallel > 1
+    log_dir = params.state_dir / "logs" if params.state_dir is not None else None
+    run_task = lambda task: _run_task(params.context, task, parallel=parallel, log_dir=log_dir)
+    compiler_cache = CompilerCache.from_context(params.context)
+    cache_stats = compiler_cache.stats() if compiler_cache is not None else None
+
+    try:
+        # All concurrently running tasks share the same job slots
+        with jobserver(params.context.jobs):
+            if not params.watch:
+                schedule.run(run_task, parallel=params.parallel)
+            else:
+                Watcher(schedule).watch(
+                    run_task,
+                    parallel=params.parallel,
+                    on_idle=lambda: _print_title("Waiting for source changes ...", Style.DIM),
+                )
+    finally:
+        if compiler_cache is not None and cache_stats is not None:
+            stats = compiler_cache.stats()
+            if stats is not None and stats != cache_stats:
+                _print_title(f"{compiler_cache.tool} {compiler_cache.summary(cache_stats, stats)}", Style.DIM)
+        if params.context.device is not None and not params.keep_device:
+            params.context.device.close()
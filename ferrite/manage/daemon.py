@@ -0,0 +1,250 @@
+from __future__ import annotations
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import os
+import sys
+import json
+import time
+import struct
+import select
+import signal
+import socket
+import threading
+import socketserver
+import traceback
+from pathlib import Path
+from contextlib import contextmanager
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Takes command line arguments, returns exit status
+Handler = Callable[[List[str]], int]
+
+_MAX_MESSAGE_SIZE = 0x10000
+
+
+def _read_message(sock: socket.socket, data: bytes = b"") -> Optional[bytes]:
+    while b"\n" not in data:
+        chunk = sock.recv(_MAX_MESSAGE_SIZE)
+        if len(chunk) == 0:
+            return None
+        data += chunk
+    return data.split(b"\n", 1)[0]
+
+
+def _connect(socket_path: Path) -> Optional[socket.socket]:
+    if not socket_path.exists():
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(socket_path))
+    except (ConnectionRefusedError, FileNotFoundError):
+        # Daemon is not running, the socket is stale
+        sock.close()
+        return None
+    return sock
+
+
+def is_running(socket_path: Path) -> bool:
+    sock = _connect(socket_path)
+    if sock is None:
+        return False
+    sock.close()
+    return True
+
+
+def request(socket_path: Path, argv: List[str]) -> Optional[int]:
+    sock = _connect(socket_path)
+    if sock is None:
+        return None
+
+    with sock:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        # Request is run with the environment and working directory of the client
+        message = json.dumps({"argv": argv, "env": dict(os.environ), "cwd": os.getcwd()}).encode("utf-8") + b"\n"
+        # Daemon writes output directly to our stdout and stderr
+        socket.send_fds(sock, [message], [sys.stdout.fileno(), sys.stderr.fileno()])
+
+        try:
+            response = _read_message(sock)
+        except KeyboardInterrupt:
+            return 130
+        if response is None:
+            print("Connection to manage daemon is lost", file=sys.stderr)
+            return 1
+        return int(json.loads(response)["status"])
+
+
+def _call_redirected(handler: Handler, argv: List[str], stdout: int, stderr: int) -> int:
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = [os.dup(1), os.dup(2)]
+    try:
+        # Subprocesses inherit redirected descriptors too
+        os.dup2(stdout, 1)
+        os.dup2(stderr, 2)
+        try:
+            return handler(argv)
+        except SystemExit as e:
+            return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except Exception:
+            traceback.print_exc()
+            return 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+    finally:
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        for fd in saved:
+            os.close(fd)
+
+
+# Raised in the serving thread when the client has gone away
+class _Cancelled(BaseException):
+    pass
+
+
+def _raise_cancelled(signum: int, frame: object) -> None:
+    raise _Cancelled()
+
+
+# Interrupts the request handled by the current thread (that must be the main one) if the client hangs up
+# (e.g. it is interrupted by Ctrl+C), so that the daemon doesn't keep running the task and writing to its terminal.
+@contextmanager
+def _cancel_on_hangup(sock: socket.socket) -> Iterator[None]:
+    done = threading.Event()
+    serving_thread = threading.get_ident()
+
+    def watch() -> None:
+        poller = select.poll()
+        poller.register(sock, select.POLLIN | select.POLLHUP)
+        while not done.is_set():
+            if len(poller.poll(200)) == 0:
+                continue
+            try:
+                data = sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                continue
+            except OSError:
+                data = b""
+            if len(data) == 0:
+                logger.warning("Client has hung up, cancelling request")
+                signal.pthread_kill(serving_thread, signal.SIGUSR1)
+                return
+            # Client is not expected to send anything else
+            time.sleep(0.2)
+
+    previous = signal.signal(signal.SIGUSR1, _raise_cancelled)
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    try:
+        yield
+    finally:
+        done.set()
+        watcher.join()
+        signal.signal(signal.SIGUSR1, previous)
+
+
+@contextmanager
+def _client_env(env: Optional[Dict[str, str]], cwd: Optional[str]) -> Iterator[None]:
+    saved_env, saved_cwd = dict(os.environ), os.getcwd()
+    try:
+        if env is not None:
+            os.environ.clear()
+            os.environ.update(env)
+        if cwd is not None:
+            os.chdir(cwd)
+        yield
+    finally:
+        os.environ.clear()
+        os.environ.update(saved_env)
+        os.chdir(saved_cwd)
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+
+    def handle(self) -> None:
+        assert isinstance(self.server, _Server)
+        sock: socket.socket = self.request
+
+        data, fds, _, _ = socket.recv_fds(sock, _MAX_MESSAGE_SIZE, 2)
+        if len(data) == 0 and len(fds) == 0:
+            # Liveness check
+            return
+        try:
+            message = _read_message(sock, data)
+            if message is None or len(fds) != 2:
+                logger.warning("Bad request received")
+                return
+            request = json.loads(message)
+            argv = [str(arg) for arg in request["argv"]]
+            logger.info(f"Request: {argv}")
+            try:
+                with _client_env(request.get("env"), request.get("cwd")), _cancel_on_hangup(sock):
+                    status = _call_redirected(self.server.handler, argv, fds[0], fds[1])
+            except _Cancelled:
+                logger.info("Request cancelled")
+                return
+            logger.info(f"Request done, status: {status}")
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+        try:
+            sock.sendall(json.dumps({"status": status}).encode("utf-8") + b"\n")
+        except BrokenPipeError:
+            logger.warning("Client has hung up before the request is done")
+
+
+def _peer_uid(sock: socket.socket) -> int:
+    _, uid, _ = struct.unpack("3i", sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")))
+    return int(uid)
+
+
+# Requests run arbitrary commands with the client environment, so only the owner of the daemon may connect.
+class _Server(socketserver.UnixStreamServer):
+
+    def __init__(self, socket_path: Path, handler: Handler) -> None:
+        self.handler = handler
+        self.socket_path = socket_path
+        super().__init__(str(socket_path), _RequestHandler)
+
+    def server_bind(self) -> None:
+        super().server_bind()
+        os.chmod(self.socket_path, 0o600)
+
+    def verify_request(self, request: Any, client_address: Any) -> bool:
+        assert isinstance(request, socket.socket)
+        uid = _peer_uid(request)
+        if uid != os.getuid():
+            logger.warning(f"Request from user {uid} is rejected")
+            return False
+        return True
+
+
+def _interrupt(signum: int, frame: object) -> None:
+    raise KeyboardInterrupt()
+
+
+# Serves requests one by one, so the state of components is never accessed concurrently.
+def serve(socket_path: Path, handler: Handler) -> None:
+    if is_running(socket_path):
+        raise RuntimeError(f"Manage daemon is already running at '{socket_path}'")
+    socket_path.unlink(missing_ok=True)
+
+    # Stop gracefully (removing the socket) on termination too
+    signal.signal(signal.SIGTERM, _interrupt)
+
+    with _Server(socket_path, handler) as server:
+        print(f"Manage daemon is listening at '{socket_path}'", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            socket_path.unlink(missing_ok=True)
+    print("Manage daemon is stopped", flush=True)
@@ -0,0 +1,233 @@
+from __future__ import annotations
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import json
+import time
+import heapq
+from pathlib import Path
+from dataclasses import dataclass, field
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from ferrite.utils.run import stop_processes
+from ferrite.components.base import Task
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TaskHistory:
+    # Weight of the last run in the stored duration estimate
+    SMOOTHING: float = 0.5
+
+    def __init__(self, path: Optional[Path] = None) -> None:
+        self.path = path
+        self.durations: Dict[str, float] = {}
+        if self.path is not None:
+            self.load()
+
+    def load(self) -> None:
+        assert self.path is not None
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError:
+            logger.warning(f"Task history '{self.path}' is corrupted, ignoring")
+            return
+        self.durations = {str(k): float(v) for k, v in data.items()}
+
+    def store(self) -> None:
+        if self.path is None:
+            return
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.durations, f, indent=2, sort_keys=True)
+        tmp_path.replace(self.path)
+
+    def estimate(self, name: str) -> Optional[float]:
+        return self.durations.get(name)
+
+    def update(self, name: str, duration: float) -> None:
+        last = self.durations.get(name)
+        if last is not None:
+            duration = self.SMOOTHING * duration + (1.0 - self.SMOOTHING) * last
+        self.durations[name] = duration
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours > 0:
+        return f"{hours}h {minutes:02}m {seconds:02}s"
+    elif minutes > 0:
+        return f"{minutes}m {seconds:02}s"
+    else:
+        return f"{seconds}s"
+
+
+# Key of the task in the schedule and in the history.
+# The name the task is registered under is used, because wrappers report the name of their inner task.
+def task_key(task: Task) -> str:
+    return task._name if task._name is not None else task.name()
+
+
+@dataclass(eq=False)
+class _Node:
+    task: Task
+    deps: List[_Node]
+    estimate: Optional[float] = None
+    dependents: List[_Node] = field(default_factory=list)
+    # Longest estimated path from the start of this task to the end of the run
+    priority: float = 0.0
+
+    @property
+    def name(self) -> str:
+        return task_key(self.task)
+
+
+@dataclass
+class Estimate:
+    critical_path: List[str]
+    critical_time: float
+    total_time: float
+    unknown: List[str]
+
+    def text(self) -> str:
+        lines = [
+            f"Estimated critical path: {format_duration(self.critical_time)} ({' -> '.join(self.critical_path)})",
+            f"Estimated total time: {format_duration(self.total_time)}",
+        ]
+        if len(self.unknown) > 0:
+            lines.append(f"No duration history for {len(self.unknown)} task(s)")
+        return "\n".join(lines)
+
+
+class Schedule:
+
+    def __init__(self, task: Task, history: Optional[TaskHistory] = None, no_deps: bool = False) -> None:
+        self.history = history if history is not None else TaskHistory()
+        # Nodes are stored in topological order, dependencies come first
+        self.nodes: Dict[str, _Node] = {}
+        self.root = self._add(task, no_deps=no_deps)
+        self._prioritize()
+
+    def _add(self, task: Task, no_deps: bool = False) -> _Node:
+        try:
+            return self.nodes[task_key(task)]
+        except KeyError:
+            pass
+
+        deps: List[_Node] = []
+        if not no_deps:
+            for dep_task in task.dependencies():
+                dep = self._add(dep_task)
+                if dep not in deps:
+                    deps.append(dep)
+
+        node = _Node(task, deps, estimate=self.history.estimate(task_key(task)))
+        for dep in deps:
+            dep.dependents.append(node)
+        self.nodes[node.name] = node
+        return node
+
+    def _prioritize(self) -> None:
+        for node in reversed(self.nodes.values()):
+            node.priority = (node.estimate or 0.0) + max([dep.priority for dep in node.dependents], default=0.0)
+
+    def estimate(self) -> Estimate:
+        path: List[str] = []
+        node: Optional[_Node] = max(
+            [node for node in self.nodes.values() if len(node.deps) == 0],
+            key=lambda n: n.priority,
+            default=None,
+        )
+        critical_time = node.priority if node is not None else 0.0
+        while node is not None:
+            path.append(node.name)
+            node = max(node.dependents, key=lambda n: n.priority, default=None)
+
+        return Estimate(
+            critical_path=path,
+            critical_time=critical_time,
+            total_time=sum([node.estimate or 0.0 for node in self.nodes.values()]),
+            unknown=[node.name for node in self.nodes.values() if node.estimate is None],
+        )
+
+    def dependents(self, names: Set[str]) -> Set[str]:
+        result: Set[str] = set()
+        stack = [self.nodes[name] for name in names]
+        while len(stack) > 0:
+            node = stack.pop()
+            if node.name not in result:
+                result.add(node.name)
+                stack.extend(node.dependents)
+        return result
+
+    # Runs tasks with dependencies. If `only` is set then tasks not in `only` are considered to be completed.
+    def run(self, run_task: Callable[[Task], None], parallel: int = 1, only: Optional[Set[str]] = None) -> None:
+        assert parallel >= 1
+
+        nodes = [node for node in self.nodes.values() if only is None or node.name in only]
+        selected = set(nodes)
+        remaining = {node: len([dep for dep in node.deps if dep in selected]) for node in nodes}
+        order = {node: i for i, node in enumerate(nodes)}
+        ready: List[Tuple[float, int, _Node]] = []
+
+        def push_ready(node: _Node) -> None:
+            heapq.heappush(ready, (-node.priority, order[node], node))
+
+        def complete(node: _Node) -> None:
+            for dep in node.dependents:
+                if dep not in remaining:
+                    continue
+                remaining[dep] -= 1
+                if remaining[dep] == 0:
+                    push_ready(dep)
+
+        def timed(node: _Node) -> None:
+            start = time.monotonic()
+            run_task(node.task)
+            # Unnamed tasks are unreachable from CLI and have no stable key
+            if node.task._name is not None:
+                self.history.update(node.name, time.monotonic() - start)
+
+        for node, count in remaining.items():
+            if count == 0:
+                push_ready(node)
+
+        try:
+            if parallel == 1:
+                while len(ready) > 0:
+                    _, _, node = heapq.heappop(ready)
+                    timed(node)
+                    complete(node)
+            else:
+                with ThreadPoolExecutor(max_workers=parallel) as executor:
+                    running: Dict[Future[None], _Node] = {}
+                    error: Optional[BaseException] = None
+                    try:
+                        while error is None and (len(ready) > 0 or len(running) > 0):
+                            while len(ready) > 0 and len(running) < parallel:
+                                _, _, node = heapq.heappop(ready)
+                                running[executor.submit(timed, node)] = node
+                            done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                            for future in done:
+                                node = running.pop(future)
+                                exc = future.exception()
+                                if exc is not None:
+                                    error = error or exc
+                                else:
+                                    complete(node)
+                        # Let already started tasks finish before reporting the failure
+                        wait(running.keys())
+                    except BaseException:
+                        # Interrupted (e.g. by Ctrl+C or client hang-up), running tasks are stopped instead of waiting for them
+                        with stop_processes():
+                            wait(running.keys())
+                        raise
+                    if error is not None:
+                        raise error
+        finally:
+            self.history.store()
@@ -1,9 +1,9 @@
 from __future__ import annotations
-from typing import Dict
+from typing import Callable, Dict
 
 from pathlib import Path
 
-from ferrite.components.base import Component, ComponentGroup
+from ferrite.components.base import Component, ComponentGroup, LazyComponentGroup
 from ferrite.components.core import CoreTest
 from ferrite.components.toolchain import CrossToolchain, HostToolchain
 from ferrite.components.codegen import CodegenExample
@@ -45,19 +45,23 @@ class _CrossComponents(ComponentGroup):
         return self.__dict__
 
 
-class _Components(ComponentGroup):
+class _Components(LazyComponentGroup):
 
     def __init__(
         self,
         source_dir: Path,
         target_dir: Path,
     ):
-        self.host = _HostComponents(source_dir, target_dir)
-        self.arm = _CrossComponents(source_dir, target_dir, ArmAppToolchain("arm", target_dir))
-        self.aarch64 = _CrossComponents(source_dir, target_dir, Aarch64AppToolchain("aarch64", target_dir))
-
-    def components(self) -> Dict[str, Component | ComponentGroup]:
-        return self.__dict__
+        self.source_dir = source_dir
+        self.target_dir = target_dir
+
+    def component_factories(self) -> Dict[str, Callable[[], Component | ComponentGroup]]:
+        source_dir, target_dir = self.source_dir, self.target_dir
+        return {
+            "host": lambda: _HostComponents(source_dir, target_dir),
+            "arm": lambda: _CrossComponents(source_dir, target_dir, ArmAppToolchain("arm", target_dir)),
+            "aarch64": lambda: _CrossComponents(source_dir, target_dir, Aarch64AppToolchain("aarch64", target_dir)),
+        }
 
 
 def make_components(base_dir: Path, target_dir: Path) -> ComponentGroup:
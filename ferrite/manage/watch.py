@@ -0,0 +1,85 @@
+from __future__ import annotations
+from typing import Callable, Dict, List, Optional, Set
+
+import time
+import traceback
+from pathlib import Path
+
+from ferrite.components.base import Task
+from ferrite.utils.scan import Scanner
+from ferrite.manage.schedule import Schedule, task_key
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Watcher:
+
+    def __init__(self, schedule: Schedule, interval: float = 0.5, debounce: float = 1.0) -> None:
+        self.schedule = schedule
+        self.interval = interval
+        self.debounce = debounce
+
+        self.sources: Dict[str, List[Path]] = {}
+        for name, node in self.schedule.nodes.items():
+            paths = node.task.source_paths()
+            if len(paths) > 0:
+                self.sources[name] = paths
+        # Keeps directory listings between polls
+        self.scanner = Scanner()
+        self.snapshots: Dict[str, List[str]] = {}
+
+        # Tasks that haven't successfully completed since their inputs changed
+        self.pending: Set[str] = set(self.schedule.nodes.keys())
+
+    def _update(self) -> Set[str]:
+        changed: Set[str] = set()
+        for name, paths in self.sources.items():
+            snapshot = [self.scanner.digest(path) for path in paths]
+            if self.snapshots.get(name) != snapshot:
+                changed.add(name)
+                self.snapshots[name] = snapshot
+        return changed
+
+    def _wait_for_changes(self) -> Set[str]:
+        changed: Set[str] = set()
+        while len(changed) == 0:
+            time.sleep(self.interval)
+            changed = self._update()
+
+        # Wait until files stop changing (e.g. editor is saving several files)
+        last_change = time.monotonic()
+        while time.monotonic() - last_change < self.debounce:
+            time.sleep(self.interval)
+            more = self._update()
+            if len(more) > 0:
+                changed |= more
+                last_change = time.monotonic()
+
+        return changed
+
+    def _run(self, run_task: Callable[[Task], None], parallel: int) -> None:
+
+        def run_and_track(task: Task) -> None:
+            run_task(task)
+            self.pending.discard(task_key(task))
+
+        try:
+            self.schedule.run(run_and_track, parallel=parallel, only=set(self.pending))
+        except Exception:
+            # Keep watching, the task will be re-run on the next change
+            traceback.print_exc()
+
+    def watch(self, run_task: Callable[[Task], None], parallel: int = 1, on_idle: Optional[Callable[[], None]] = None) -> None:
+        try:
+            self._update()
+            while True:
+                self._run(run_task, parallel)
+                if on_idle is not None:
+                    on_idle()
+                changed = self._wait_for_changes()
+                logger.info(f"Sources of {sorted(changed)} changed")
+                self.pending |= self.schedule.dependents(changed)
+        except KeyboardInterrupt:
+            pass
@@ -1,9 +1,12 @@
 from __future__ import annotations
-from typing import List, Optional
+from typing import List, Optional, Tuple, Union
 
 from pathlib import Path, PurePosixPath
 from subprocess import Popen
 
+# File to store on device: local file path or in-memory text, and remote path
+StoreItem = Tuple[Union[Path, str], PurePosixPath]
+
 
 class Connection:
 
@@ -22,8 +25,20 @@ class Device:
     def store_mem(self, src_data: str, dst_path: PurePosixPath) -> None:
         raise NotImplementedError()
 
+    # Stores several files at once. Devices may do it in a single session.
+    def store_batch(self, items: List[StoreItem]) -> None:
+        for src, dst in items:
+            if isinstance(src, Path):
+                self.store(src, dst)
+            else:
+                self.store_mem(src, dst)
+
     def run(self, args: List[str], wait: bool = False) -> Optional[Connection]:
         raise NotImplementedError()
 
     def reboot(self) -> None:
         raise NotImplementedError()
+
+    # Releases connections to the device. The device can still be used after that, connections are reopened.
+    def close(self) -> None:
+        pass
@@ -1,21 +1,35 @@
 from __future__ import annotations
-from typing import List, Optional, Tuple
+from typing import TYPE_CHECKING, Iterator, List, Optional, Tuple
 
+import io
 import time
+import stat
+import shlex
+import shutil
+import socket
+import tarfile
+import tempfile
+import threading
+import subprocess
 from subprocess import Popen
 from pathlib import Path, PurePosixPath
+from contextlib import contextmanager
 
-from paramiko import SSHClient
-from paramiko.channel import ChannelFile
-
-from ferrite.utils.run import run, RunError
+from ferrite.utils.run import run, capture, RunError
 from ferrite.utils.strings import quote
-from ferrite.remote.base import Connection, Device
+from ferrite.remote.base import Connection, Device, StoreItem
+
+if TYPE_CHECKING:
+    # Paramiko is slow to import, so it is imported only when it is used.
+    from paramiko import SFTPClient
 
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Time (in seconds) to keep idle master connection open after the last session
+CONTROL_PERSIST = 600
+
 
 def _split_addr(addr: str) -> Tuple[str, int]:
     comps = addr.split(":")
@@ -27,14 +41,9 @@ def _split_addr(addr: str) -> Tuple[str, int]:
         raise Exception(f"Bad address format: '{addr}'")
 
 
-class _ParamikoConnection(Connection):
-
-    def __init__(self, client: SSHClient, channels: List[ChannelFile]) -> None:
-        self.client = client
-        self.channels = channels
-
-    def close(self) -> None:
-        self.client.close()
+# SFTP server or its extension required by `SshDevice.store_batch` is not available on the device
+class _SftpUnsupported(Exception):
+    pass
 
 
 class SshConnection(Connection):
@@ -59,10 +68,28 @@ class SshDevice(Device):
 
         self.user = user
 
+        self._lock = threading.Lock()
+        self._control_dir: Optional[Path] = None
+
+    # Options to share a single authenticated connection (OpenSSH ControlMaster) between all `ssh` runs.
+    def _ssh_opts(self) -> List[str]:
+        with self._lock:
+            if self._control_dir is None:
+                self._control_dir = Path(tempfile.mkdtemp(prefix="ferrite-ssh-"))
+            control_dir = self._control_dir
+        return [
+            *["-o", "ControlMaster=auto"],
+            *["-o", f"ControlPath={control_dir}/%C"],
+            *["-o", f"ControlPersist={CONTROL_PERSIST}"],
+        ]
+
+    def _ssh(self) -> List[str]:
+        return ["ssh", "-p", str(self.port), *self._ssh_opts()]
+
     def store(self, src: Path, dst: PurePosixPath, recursive: bool = False, exclude: List[str] = []) -> None:
         if not recursive:
             assert len(exclude) == 0, "'exclude' is not supported"
-            run(["bash", "-c", f"test -f {src} && cat {src} | ssh -p {self.port} {self.user}@{self.host} 'cat > {dst}'"])
+            self.store_batch([(src, dst)])
         else:
             run([
                 "rsync",
@@ -70,7 +97,7 @@ class SshDevice(Device):
                 *["--exclude=" + mask.replace('*', '**') for mask in exclude],
                 "--progress",
                 "--rsh",
-                f"ssh -p {self.port}",
+                " ".join(self._ssh()),
                 f"{src}/",
                 f"{self.user}@{self.host}:{dst}",
             ])
@@ -78,10 +105,112 @@ class SshDevice(Device):
     def store_mem(self, src_data: str, dst_path: PurePosixPath) -> None:
         logger.debug(f"Store {len(src_data)} chars to {self.name()}:{dst_path}")
         logger.debug(src_data)
-        run(["bash", "-c", f"echo {quote(src_data)} | ssh -p {self.port} {self.user}@{self.host} 'cat > {dst_path}'"])
+        self.store_batch([(src_data, dst_path)])
+
+    # SFTP session is run by `ssh`, so it goes through the master connection and `~/.ssh/config` is respected.
+    @contextmanager
+    def _sftp(self) -> Iterator[SFTPClient]:
+        from paramiko import SFTPClient, SSHException
+
+        cmd = [*self._ssh(), "-s", f"{self.user}@{self.host}", "sftp"]
+        sock, proc_sock = socket.socketpair()
+        with proc_sock:
+            proc = Popen(cmd, stdin=proc_sock.fileno(), stdout=proc_sock.fileno())
+        try:
+            try:
+                # Paramiko supports plain sockets too
+                sftp = SFTPClient(sock) # type: ignore[arg-type]
+            except (SSHException, OSError):
+                raise _SftpUnsupported(f"SFTP session to {self.name()} failed (ssh exit status {proc.wait()})")
+            with sftp:
+                yield sftp
+        finally:
+            sock.close()
+            proc.wait()
+
+    def _store_sftp(self, sftp: SFTPClient, src: Path | str, dst: PurePosixPath) -> None:
+        tmp = str(dst.parent / f".{dst.name}.tmp")
+        try:
+            if isinstance(src, Path):
+                logger.debug(f"Store {src} to {self.name()}:{dst}")
+                sftp.put(str(src), tmp)
+                mode = stat.S_IMODE(src.stat().st_mode)
+            else:
+                sftp.putfo(io.BytesIO(src.encode("utf-8")), tmp)
+                mode = 0o644
+            sftp.chmod(tmp, mode)
+            try:
+                sftp.posix_rename(tmp, str(dst))
+            except IOError as e:
+                # Errors of known kind (e.g. permission denied) have `errno` set
+                if e.errno is None:
+                    raise _SftpUnsupported(f"'posix-rename' SFTP extension is not supported by {self.name()}: {e}")
+                raise
+        except BaseException:
+            # Don't leave partially written file on the device
+            try:
+                sftp.remove(tmp)
+            except Exception:
+                pass
+            raise
+
+    # Fallback for devices without SFTP (e.g. Dropbear without sftp-server).
+    # Files are sent to their temporary paths in a single tar stream and then renamed in place.
+    def _store_tar(self, items: List[StoreItem]) -> None:
+        if any([not dst.is_absolute() for _, dst in items]):
+            # Relative paths are relative to the home directory
+            home = PurePosixPath(capture(self._prefix() + ["pwd"]))
+            items = [(src, home / dst) for src, dst in items]
+
+        entries: List[Tuple[Path | str, PurePosixPath, int]] = []
+        for src, dst in items:
+            mode = stat.S_IMODE(src.stat().st_mode) if isinstance(src, Path) else 0o644
+            entries.append((src, dst.parent / f".{dst.name}.tmp", mode))
+        renames = [
+            f"chmod {mode:o} {shlex.quote(str(tmp))} && mv -f {shlex.quote(str(tmp))} {shlex.quote(str(dst))}"
+            for (_, tmp, mode), (_, dst) in zip(entries, items)
+        ]
+        cleanup = " ".join([shlex.quote(str(tmp)) for _, tmp, _ in entries])
+        script = f"tar -x -o -f - -C / && {' && '.join(renames)} || {{ rm -f {cleanup}; exit 1; }}"
+
+        logger.debug(f"Store {len(items)} file(s) to {self.name()} over tar stream")
+        with Popen(self._prefix() + [script], stdin=subprocess.PIPE) as proc:
+            assert proc.stdin is not None
+            try:
+                with tarfile.open(fileobj=proc.stdin, mode="w|") as tar:
+                    for src, tmp, mode in entries:
+                        name = str(tmp.relative_to("/"))
+                        if isinstance(src, Path):
+                            tar.add(src, name, recursive=False)
+                        else:
+                            data = src.encode("utf-8")
+                            info = tarfile.TarInfo(name)
+                            info.size, info.mode, info.mtime = len(data), mode, int(time.time())
+                            tar.addfile(info, io.BytesIO(data))
+                proc.stdin.close()
+            except BrokenPipeError:
+                # Exit status is reported below
+                pass
+        if proc.returncode != 0:
+            raise RunError(proc.returncode, proc.args)
+
+    # Uploads all files over a single SFTP session (or a single tar stream if SFTP is not supported by the device).
+    # Each file is written to a temporary file first and then renamed, so the remote file is replaced atomically.
+    def store_batch(self, items: List[StoreItem]) -> None:
+        if len(items) == 0:
+            return
+        stored = 0
+        try:
+            with self._sftp() as sftp:
+                for src, dst in items:
+                    self._store_sftp(sftp, src, dst)
+                    stored += 1
+        except _SftpUnsupported as e:
+            logger.info(f"{e}, falling back to tar")
+            self._store_tar(items[stored:])
 
     def _prefix(self) -> List[str | Path]:
-        return ["ssh", "-p", str(self.port), f"{self.user}@{self.host}"]
+        return [*self._ssh(), f"{self.user}@{self.host}"]
 
     def name(self) -> str:
         return f"{self.user}@{self.host}:{self.port}"
@@ -96,24 +225,22 @@ class SshDevice(Device):
             logger.info(f"SSH popen {self.name()} {args}")
             return SshConnection(Popen(self._prefix() + [argstr]))
 
-    def _paramiko_client(self) -> SSHClient:
-        client = SSHClient()
-        client.load_system_host_keys()
-        client.connect(self.host, port=self.port, username=self.user)
-        return client
+    def close(self) -> None:
+        with self._lock:
+            control_dir, self._control_dir = self._control_dir, None
 
-    def _paramiko_run(self, args: List[str], wait: bool = True) -> Optional[_ParamikoConnection]:
-        client = self._paramiko_client()
-        argstr = " ".join([quote(a) for a in args])
-        logger.info(f"SSH run {self.name()} {args}")
-        _, stdout, stderr = client.exec_command(argstr, timeout=None if wait else 0)
-        if wait:
-            print(stderr.read())
-            print(stdout.read())
-            return None
-        else:
-            logger.info(f"SSH popen {self.name()} {args}")
-            return _ParamikoConnection(client, [stderr, stdout])
+        if control_dir is not None:
+            if any(control_dir.iterdir()):
+                logger.debug(f"Closing master connection to {self.name()}")
+                subprocess.run(
+                    [
+                        "ssh", "-p",
+                        str(self.port), "-o", f"ControlPath={control_dir}/%C", "-O", "exit", f"{self.user}@{self.host}"
+                    ],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+            shutil.rmtree(control_dir, ignore_errors=True)
 
     def wait_online(self, attempts: int = 10, timeout: float = 10.0) -> None:
         time.sleep(timeout)
@@ -135,6 +262,8 @@ class SshDevice(Device):
             self.run(["reboot", "now"])
         except:
             pass
+        # Connections do not survive reboot
+        self.close()
 
         logger.info("Waiting for device to reboot ...")
         self.wait_online()
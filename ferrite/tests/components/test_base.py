@@ -0,0 +1,60 @@
+from __future__ import annotations
+from typing import Callable, Dict, List
+
+from ferrite.components.base import Component, ComponentGroup, LazyComponentGroup, Task
+
+
+class _Task(Task):
+    pass
+
+
+class _Comp(Component):
+
+    def __init__(self) -> None:
+        self.build_task = _Task()
+
+    def tasks(self) -> Dict[str, Task]:
+        return {"build": self.build_task}
+
+
+class _Group(ComponentGroup):
+
+    def __init__(self) -> None:
+        self.a = _Comp()
+        self._b = _Comp()
+
+    def components(self) -> Dict[str, Component | ComponentGroup]:
+        return self.__dict__
+
+
+class _Lazy(LazyComponentGroup):
+
+    def __init__(self, constructed: List[str]) -> None:
+        self.constructed = constructed
+
+    def _make(self, name: str) -> Component:
+        self.constructed.append(name)
+        return _Group()
+
+    def component_factories(self) -> Dict[str, Callable[[], Component | ComponentGroup]]:
+        return {"x": lambda: self._make("x"), "y": lambda: self._make("y")}
+
+
+def test_group() -> None:
+    group = _Group()
+    group._update_names()
+    assert list(group.tasks().keys()) == ["a.build", "_b.build"]
+    # Caches are not exposed as components
+    assert list(group.__dict__.keys()) == ["a", "_b"]
+    assert group.task("_b.build").name() == "_b.build"
+
+
+def test_lazy_group() -> None:
+    constructed: List[str] = []
+    tree = _Lazy(constructed)
+    tree._update_names()
+    assert tree.task("y.a.build").name() == "y.a.build"
+    assert constructed == ["y"]
+    assert list(tree.tasks().keys()) == ["x.a.build", "x._b.build", "y.a.build", "y._b.build"]
+    assert constructed == ["y", "x"]
+    assert tree.task("x._b.build").name() == "x._b.build"
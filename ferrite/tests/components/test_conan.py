@@ -0,0 +1,39 @@
+from __future__ import annotations
+from typing import Dict, List
+
+from pathlib import Path
+
+import pytest
+
+from ferrite.components.conan import ConanfileConflictError, make_conanfile
+
+
+def _conanfile(path: Path, requires: Dict[str, str], deps: List[str] = []) -> None:
+    path.mkdir(parents=True, exist_ok=True)
+    lines = ["[requires]", *[f'{name} = "{version}"' for name, version in requires.items()]]
+    for dep in deps:
+        lines.extend(["[[dependencies]]", f'path = "{dep}"'])
+    (path / "conanfile.toml").write_text("\n".join(lines) + "\n")
+
+
+def test_diamond(tmp_path: Path) -> None:
+    _conanfile(tmp_path / "app", {"fmt": "8.0.1"}, ["../left", "../right"])
+    _conanfile(tmp_path / "left", {"gtest": "1.11.0"}, ["../core"])
+    _conanfile(tmp_path / "right", {"gtest": "1.11.0"}, ["../core"])
+    _conanfile(tmp_path / "core", {"fmt": "8.0.1"})
+
+    conanfile = make_conanfile(tmp_path / "app")
+    assert conanfile.requires == ["fmt/8.0.1", "gtest/1.11.0"]
+
+
+def test_conflict(tmp_path: Path) -> None:
+    _conanfile(tmp_path / "app", {"fmt": "8.0.1"}, ["../a", "../b", "../c"])
+    _conanfile(tmp_path / "a", {"fmt": "7.1.3"})
+    # Declares the first seen version after the conflict is found
+    _conanfile(tmp_path / "b", {"fmt": "8.0.1"})
+    _conanfile(tmp_path / "c", {"fmt": "7.1.3"})
+
+    with pytest.raises(ConanfileConflictError) as e:
+        make_conanfile(tmp_path / "app")
+    paths = {name: tmp_path / name for name in ["app", "a", "b", "c"]}
+    assert f"fmt: 8.0.1 (from {paths['app']}, {paths['b']}), 7.1.3 (from {paths['a']}, {paths['c']})" in str(e.value)
@@ -0,0 +1,34 @@
+from __future__ import annotations
+from typing import Dict
+
+import shutil
+import argparse
+
+import pytest
+
+from ferrite.components.base import Component, Task
+from ferrite.manage.cli import add_parser_args, read_run_params
+
+
+class _Comp(Component):
+
+    def __init__(self) -> None:
+        self.build_task = Task()
+
+    def tasks(self) -> Dict[str, Task]:
+        return {"build": self.build_task}
+
+
+def test_missing_compiler_cache(monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]) -> None:
+    monkeypatch.setattr(shutil, "which", lambda cmd: None)
+    comp = _Comp()
+    parser = argparse.ArgumentParser()
+    add_parser_args(parser, comp)
+
+    with pytest.raises(SystemExit) as e:
+        read_run_params(parser.parse_args(["build", "--compiler-cache", "ccache"]), comp)
+    assert e.value.code == 1
+    assert capsys.readouterr().out == "Compiler cache 'ccache' is not found\n"
+
+    params = read_run_params(parser.parse_args(["build"]), comp)
+    assert params.task is comp.build_task
@@ -0,0 +1,87 @@
+from __future__ import annotations
+from typing import Iterator
+
+import os
+import sys
+import json
+import time
+import socket
+import subprocess
+from pathlib import Path
+from contextlib import contextmanager
+
+import pytest
+
+from ferrite.manage import daemon
+
+# Handler prints its environment and working directory, or hangs until it is cancelled
+_DAEMON = """
+import os, sys, time
+from pathlib import Path
+from ferrite.manage import daemon
+
+def handle(argv):
+    if argv == ["hang"]:
+        try:
+            time.sleep(30)
+        finally:
+            Path(sys.argv[2]).write_text("cancelled")
+    print(os.environ.get("FERRITE_TEST_VALUE"), os.getcwd(), flush=True)
+    return 3
+
+daemon.serve(Path(sys.argv[1]), handle)
+"""
+
+
+@contextmanager
+def _serve(tmp_path: Path) -> Iterator[Path]:
+    socket_path = tmp_path / "manage.sock"
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+    proc = subprocess.Popen(
+        [sys.executable, "-c", _DAEMON, str(socket_path),
+         str(tmp_path / "marker")],
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        while not daemon.is_running(socket_path):
+            assert proc.poll() is None
+            time.sleep(0.05)
+        yield socket_path
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def test_client_env(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capfd: pytest.CaptureFixture[str]) -> None:
+    with _serve(tmp_path) as socket_path:
+        monkeypatch.setenv("FERRITE_TEST_VALUE", "client")
+        monkeypatch.chdir(tmp_path)
+        assert daemon.request(socket_path, ["run"]) == 3
+    assert capfd.readouterr().out == f"client {tmp_path}\n"
+
+
+def test_cancel_on_hangup(tmp_path: Path) -> None:
+    with _serve(tmp_path) as socket_path:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(str(socket_path))
+        message = json.dumps({"argv": ["hang"]}).encode("utf-8") + b"\n"
+        with open(os.devnull, "w") as null:
+            socket.send_fds(sock, [message], [null.fileno(), null.fileno()])
+        time.sleep(0.5)
+        sock.close()
+
+        start = time.monotonic()
+        while not (tmp_path / "marker").exists():
+            assert time.monotonic() - start < 5.0
+            time.sleep(0.05)
+        # Daemon is still serving
+        assert daemon.is_running(socket_path)
+
+
+def test_socket_owner_only(tmp_path: Path) -> None:
+    with _serve(tmp_path) as socket_path:
+        assert socket_path.stat().st_mode & 0o777 == 0o600
+    left, right = socket.socketpair()
+    with left, right:
+        assert daemon._peer_uid(left) == os.getuid()
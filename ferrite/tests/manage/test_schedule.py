@@ -0,0 +1,160 @@
+from __future__ import annotations
+from typing import Dict, List, Optional
+
+import time
+import signal
+import threading
+from pathlib import Path
+
+import pytest
+
+from ferrite.utils.run import run
+from ferrite.components.base import Context, Task, TaskWrapper
+from ferrite.manage.schedule import Schedule, TaskHistory
+
+
+class _Task(Task):
+
+    def __init__(self, name: str, deps: List[Task] = [], duration: float = 0.0, fail: bool = False) -> None:
+        super().__init__()
+        self._name = name
+        self.deps = deps
+        self.duration = duration
+        self.fail = fail
+
+    def run(self, ctx: Context) -> None:
+        time.sleep(self.duration)
+        if self.fail:
+            raise RuntimeError(f"{self._name} failed")
+
+    def dependencies(self) -> List[Task]:
+        return self.deps
+
+
+def _history(durations: Dict[str, float], path: Optional[Path] = None) -> TaskHistory:
+    history = TaskHistory(path)
+    history.durations.update(durations)
+    return history
+
+
+def _run(schedule: Schedule, parallel: int = 1, only: Optional[List[str]] = None) -> List[str]:
+    order: List[str] = []
+    lock = threading.Lock()
+
+    def run_task(task: Task) -> None:
+        task.run(Context())
+        with lock:
+            order.append(task.name())
+
+    schedule.run(run_task, parallel=parallel, only=set(only) if only is not None else None)
+    return order
+
+
+def _diamond() -> Task:
+    base = _Task("base")
+    return _Task("all", [_Task("short", [base]), _Task("long", [_Task("gen", [base])]), _Task("mid", [base])])
+
+
+def test_critical_path_first() -> None:
+    history = _history({"base": 1.0, "short": 1.0, "gen": 4.0, "long": 2.0, "mid": 3.0, "all": 1.0})
+    schedule = Schedule(_diamond(), history)
+    # Tasks on the longest path are started first
+    assert _run(schedule) == ["base", "gen", "mid", "long", "short", "all"]
+
+
+def test_estimate() -> None:
+    history = _history({"base": 1.0, "short": 1.0, "gen": 4.0, "long": 2.0, "all": 1.0})
+    estimate = Schedule(_diamond(), history).estimate()
+    assert estimate.critical_path == ["base", "gen", "long", "all"]
+    assert estimate.critical_time == 8.0
+    assert estimate.total_time == 9.0
+    assert estimate.unknown == ["mid"]
+
+    empty = Schedule(_diamond()).estimate()
+    assert empty.critical_time == 0.0 and empty.total_time == 0.0
+    assert len(empty.unknown) == 6
+
+
+def test_history(tmp_path: Path) -> None:
+    path = tmp_path / "durations.json"
+    history = TaskHistory(path)
+    history.update("a", 10.0)
+    assert history.estimate("a") == 10.0
+    # New duration is averaged with the stored one
+    history.update("a", 20.0)
+    assert history.estimate("a") == 15.0
+    history.store()
+    assert TaskHistory(path).durations == {"a": 15.0}
+
+    Schedule(_Task("b", [_Task("c")]), TaskHistory(path)).run(lambda task: None)
+    assert sorted(TaskHistory(path).durations.keys()) == ["a", "b", "c"]
+
+    path.write_text("{")
+    assert TaskHistory(path).durations == {}
+
+
+def test_only() -> None:
+    schedule = Schedule(_diamond())
+    # Tasks not in `only` are considered completed
+    assert _run(schedule, only=["all", "gen", "short"]) == ["short", "gen", "all"]
+    assert _run(schedule, only=["base"]) == ["base"]
+    assert schedule.dependents({"gen"}) == {"gen", "long", "all"}
+
+
+def test_error_parallel() -> None:
+    base = _Task("base")
+    slow = _Task("slow", [base], duration=0.3)
+    failing = _Task("failing", [base], duration=0.1, fail=True)
+    schedule = Schedule(_Task("all", [slow, failing, _Task("after", [failing])]), _history({"slow": 1.0}))
+    order: List[str] = []
+
+    def run_task(task: Task) -> None:
+        task.run(Context())
+        order.append(task.name())
+
+    with pytest.raises(RuntimeError, match="failing failed"):
+        schedule.run(run_task, parallel=4)
+    # Already started task is completed, dependents of the failed one are not run
+    assert order == ["base", "slow"]
+
+
+def test_wrapper_key() -> None:
+    inner = _Task("inner")
+    wrapper = TaskWrapper(inner, deps=[_Task("dep")])
+    wrapper._name = "wrapper"
+    history = _history({"inner": 1.0, "wrapper": 5.0})
+    schedule = Schedule(_Task("all", [inner, wrapper]), history)
+    assert list(schedule.nodes.keys()) == ["inner", "dep", "wrapper", "all"]
+    assert schedule.nodes["wrapper"].estimate == 5.0
+
+    _run(schedule)
+    assert history.durations["wrapper"] < 5.0 and history.durations["inner"] < 1.0
+
+
+class _Interrupted(BaseException):
+    pass
+
+
+def _interrupt(signum: int, frame: object) -> None:
+    raise _Interrupted()
+
+
+def _sleep(task: Task) -> None:
+    run(["sleep", "10"])
+
+
+def test_interrupt_parallel() -> None:
+    schedule = Schedule(_Task("all", [_Task("a"), _Task("b")]))
+    main = threading.get_ident()
+    timer = threading.Timer(0.5, lambda: signal.pthread_kill(main, signal.SIGUSR1))
+    previous = signal.signal(signal.SIGUSR1, _interrupt)
+    start = time.monotonic()
+    try:
+        timer.start()
+        with pytest.raises(_Interrupted):
+            # Processes of the running tasks are killed instead of waiting for them
+            schedule.run(_sleep, parallel=2)
+    finally:
+        timer.cancel()
+        signal.signal(signal.SIGUSR1, previous)
+    assert time.monotonic() - start < 5.0
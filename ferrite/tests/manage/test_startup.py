@@ -0,0 +1,79 @@
+from __future__ import annotations
+from typing import Any, Dict
+
+import sys
+import json
+import subprocess
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parents[3]
+
+HEAVY_MODULES = ["asyncio", "paramiko", "pydantic", "toml", "numpy", "ssl", "urllib.request"]
+
+# Constructs the whole component tree and lists all tasks like `python -m ferrite.manage --help` does.
+# Processes started meanwhile (e.g. compiler probes) are recorded instead of being run.
+_SCRIPT = f"""
+import sys, json, subprocess
+from pathlib import Path
+
+commands = []
+
+class Popen(subprocess.Popen):
+    def __init__(self, args, *posargs, **kwargs):
+        commands.append([str(arg) for arg in args] if isinstance(args, (list, tuple)) else str(args))
+        raise OSError("processes must not be started on startup")
+
+subprocess.Popen = Popen
+
+import ferrite.manage.cli
+from ferrite.manage.tree import make_components
+components = make_components(Path.cwd(), Path.cwd() / "target")
+components.tasks()
+
+print(json.dumps({{
+    "commands": commands,
+    "heavy_modules": [m for m in {HEAVY_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+
+def _startup_stats() -> Dict[str, Any]:
+    output = subprocess.run(
+        [sys.executable, "-c", _SCRIPT],
+        cwd=BASE_DIR,
+        check=True,
+        stdout=subprocess.PIPE,
+    ).stdout
+    result: Dict[str, Any] = json.loads(output)
+    return result
+
+
+def test_heavy_modules_are_not_imported() -> None:
+    assert _startup_stats()["heavy_modules"] == []
+
+
+def test_no_processes_on_startup() -> None:
+    assert _startup_stats()["commands"] == []
+
+
+# Cumulative import time of `module` in microseconds as reported by `python -X importtime`
+def _import_time_us(module: str) -> int:
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BASE_DIR,
+        check=True,
+        stderr=subprocess.PIPE,
+    ).stderr.decode()
+    for line in stderr.splitlines():
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1])
+    raise AssertionError(f"No import time reported for '{module}'")
+
+
+def test_import_time() -> None:
+    # Take the best of several runs to reduce noise
+    import_time = min([_import_time_us("ferrite.manage.cli") for _ in range(3)]) / 1e6
+    print(f"import ferrite.manage.cli: {1000 * import_time:.1f} ms")
+    # Loose bound that is only exceeded if something heavy is imported again, timing depends on the machine load
+    assert import_time < 2.0
@@ -0,0 +1,204 @@
+from __future__ import annotations
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+
+import os
+from pathlib import Path, PurePosixPath
+from contextlib import contextmanager
+
+import pytest
+
+from ferrite.utils.run import RunError
+from ferrite.remote.ssh import SshDevice
+from ferrite.remote.base import StoreItem
+
+
+class _FakeSftp:
+
+    def __init__(self, fail_on: Optional[str] = None) -> None:
+        self.fail_on = fail_on
+        self.files: Dict[str, Tuple[bytes, int]] = {}
+        self.sessions = 0
+
+    def _write(self, data: bytes, path: str) -> None:
+        self.files[path] = (data, 0)
+        if self.fail_on is not None and path.endswith(self.fail_on):
+            raise KeyboardInterrupt()
+
+    def put(self, local: str, remote: str) -> None:
+        self._write(Path(local).read_bytes(), remote)
+
+    def putfo(self, file: IO[bytes], remote: str) -> None:
+        self._write(file.read(), remote)
+
+    def chmod(self, path: str, mode: int) -> None:
+        self.files[path] = (self.files[path][0], mode)
+
+    def posix_rename(self, src: str, dst: str) -> None:
+        self.files[dst] = self.files.pop(src)
+
+    def remove(self, path: str) -> None:
+        del self.files[path]
+
+
+def _device(monkeypatch: pytest.MonkeyPatch, sftp: _FakeSftp) -> SshDevice:
+
+    @contextmanager
+    def session(self: SshDevice) -> Iterator[_FakeSftp]:
+        sftp.sessions += 1
+        yield sftp
+
+    monkeypatch.setattr(SshDevice, "_sftp", session)
+    return SshDevice("device:2222")
+
+
+def test_store_batch(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    sftp = _FakeSftp()
+    device = _device(monkeypatch, sftp)
+    (tmp_path / "run.sh").write_text("exit 0")
+    (tmp_path / "run.sh").chmod(0o755)
+
+    device.store_batch([(tmp_path / "run.sh", PurePosixPath("/opt/run.sh")), ("A=1", PurePosixPath("/opt/env"))])
+    assert sftp.sessions == 1
+    assert sftp.files == {"/opt/run.sh": (b"exit 0", 0o755), "/opt/env": (b"A=1", 0o644)}
+
+    device.store_batch([])
+    assert sftp.sessions == 1
+
+
+def test_store_batch_cleanup(monkeypatch: pytest.MonkeyPatch) -> None:
+    sftp = _FakeSftp(fail_on=".b.tmp")
+    device = _device(monkeypatch, sftp)
+    with pytest.raises(KeyboardInterrupt):
+        device.store_batch([("a", PurePosixPath("/opt/a")), ("b", PurePosixPath("/opt/b")), ("c", PurePosixPath("/opt/c"))])
+    # Temporary file of the interrupted upload is removed
+    assert sftp.files == {"/opt/a": (b"a", 0o644)}
+
+
+def test_rename_unsupported(monkeypatch: pytest.MonkeyPatch) -> None:
+    sftp = _FakeSftp()
+    device = _device(monkeypatch, sftp)
+    fallback: List[StoreItem] = []
+    monkeypatch.setattr(device, "_store_tar", fallback.extend)
+
+    def posix_rename(src: str, dst: str) -> None:
+        if dst.endswith("/b"):
+            raise IOError("Operation unsupported")
+        sftp.files[dst] = sftp.files.pop(src)
+
+    monkeypatch.setattr(sftp, "posix_rename", posix_rename)
+    device.store_batch([("a", PurePosixPath("/opt/a")), ("b", PurePosixPath("/opt/b")), ("c", PurePosixPath("/opt/c"))])
+    assert sftp.files == {"/opt/a": (b"a", 0o644)}
+    # The rest is stored in a single tar stream
+    assert fallback == [("b", PurePosixPath("/opt/b")), ("c", PurePosixPath("/opt/c"))]
+
+
+# Device without SFTP server, commands are run locally
+def _no_sftp_ssh(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    log_path = tmp_path / "calls"
+    (tmp_path / "ssh").write_text(
+        "#!/bin/sh\n"
+        f"echo \"$@\" >> {log_path}\n"
+        "for arg; do last=$arg; done\n"
+        "if [ \"$last\" = sftp ]; then exit 1; fi\n"
+        "exec sh -c \"$last\"\n"
+    )
+    (tmp_path / "ssh").chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    return log_path
+
+
+def test_store_without_sftp(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    log_path = _no_sftp_ssh(tmp_path, monkeypatch)
+    dst = tmp_path / "device"
+    dst.mkdir()
+    (dst / "env").write_text("old")
+    (tmp_path / "run.sh").write_text("exit 0")
+    (tmp_path / "run.sh").chmod(0o755)
+
+    device = SshDevice("device")
+    device.store_batch([
+        (tmp_path / "run.sh", PurePosixPath(dst / "run.sh")),
+        ("A=1", PurePosixPath(dst / "env")),
+    ])
+    assert sorted([path.name for path in dst.iterdir()]) == ["env", "run.sh"]
+    assert (dst / "env").read_text() == "A=1" and (dst / "env").stat().st_mode & 0o777 == 0o644
+    assert (dst / "run.sh").read_text() == "exit 0" and (dst / "run.sh").stat().st_mode & 0o777 == 0o755
+    assert len(log_path.read_text().splitlines()) == 2
+
+    # Temporary files are removed on failure
+    (tmp_path / "mv").write_text("#!/bin/sh\nexit 1\n")
+    (tmp_path / "mv").chmod(0o755)
+    with pytest.raises(RunError):
+        device.store_batch([("B=2", PurePosixPath(dst / "env")), ("C=3", PurePosixPath(dst / "c"))])
+    assert sorted([path.name for path in dst.iterdir()]) == ["env", "run.sh"]
+    assert (dst / "env").read_text() == "A=1"
+    device.close()
+
+
+def test_connection_error(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    args_path = tmp_path / "args"
+    (tmp_path / "ssh").write_text(f"#!/bin/sh\necho \"$@\" >> {args_path}\nexit 255\n")
+    (tmp_path / "ssh").chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+
+    device = SshDevice("device:2222", user="user")
+    with pytest.raises(RunError) as e:
+        device.store_mem("A=1", PurePosixPath("/opt/env"))
+    assert e.value.returncode == 255
+    sftp_args, tar_args = args_path.read_text().splitlines()
+    assert sftp_args.split()[:2] == ["-p", "2222"] and sftp_args.split()[-3:] == ["-s", "user@device", "sftp"]
+    assert "user@device tar -x" in tar_args
+    device.close()
+
+
+def _fake_ssh(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    log_path = tmp_path / "calls"
+    (tmp_path / "ssh").write_text(f"#!/bin/sh\necho \"$@\" >> {log_path}\n")
+    (tmp_path / "ssh").chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    return log_path
+
+
+def _control_path(args: str) -> str:
+    return [arg for arg in args.split() if arg.startswith("ControlPath=")][0]
+
+
+def test_connection_reuse(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    log_path = _fake_ssh(tmp_path, monkeypatch)
+    device = SshDevice("device")
+    device.run(["uname", "-a"])
+    conn = device.run(["sleep", "1"], wait=False)
+    assert conn is not None
+    conn.proc.wait()
+    # Fake `ssh` doesn't talk SFTP, so the file is sent by tar
+    device.store_mem("A=1", PurePosixPath("/opt/env"))
+
+    calls = log_path.read_text().splitlines()
+    assert len(calls) == 4
+    assert all(["ControlMaster=auto" in args for args in calls])
+    # All sessions go through the same master connection
+    assert len(set([_control_path(args) for args in calls])) == 1
+    device.close()
+
+
+def test_close(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    log_path = _fake_ssh(tmp_path, monkeypatch)
+    device = SshDevice("device:2222")
+    device.run(["true"])
+    control_path = _control_path(log_path.read_text())
+    control_dir = Path(control_path.split("=", 1)[1]).parent
+    # Master connection socket
+    (control_dir / "master").touch()
+
+    device.close()
+    assert log_path.read_text().splitlines()[-1] == f"-p 2222 -o {control_path} -O exit root@device"
+    assert not control_dir.exists()
+    device.close()
+    assert len(log_path.read_text().splitlines()) == 2
+
+    # Device is usable after close with a new master connection
+    device.run(["true"])
+    assert _control_path(log_path.read_text().splitlines()[-1]) != control_path
+    device.close()
+    # No master connection was started, so there is nothing to stop
+    assert len(log_path.read_text().splitlines()) == 3
@@ -2,12 +2,19 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 
+import sys
 import time
 import asyncio
+import subprocess
+from pathlib import Path
 from asyncio import CancelledError, ensure_future
-from typing import Any
+from typing import Any, List
 
-from ferrite.utils.asyncio import forever, cancel_and_wait, with_background
+import pytest
+
+from ferrite.utils.asyncio import forever, cancel_and_wait, capture_async, run_async, with_background
+
+_PRINT_LINES = "import sys\nfor i in range(1000): print(f'line {i}')\nsys.exit(int(sys.argv[1]))"
 
 
 async def _immediate() -> None:
@@ -135,3 +142,39 @@ async def test_with_background_secondary_block_loop() -> None:
 
     await with_background(fore, back)
     assert fore.done() and back.done()
+
+
+async def test_capture_async() -> None:
+    lines: List[str] = []
+    output = await run_async([sys.executable, "-c", _PRINT_LINES, "0"], capture=True, on_line=lines.append)
+    assert output is not None and output.splitlines() == lines
+    assert await capture_async(["echo", "$VALUE"], add_env={"VALUE": "1"}) == "$VALUE"
+    assert await capture_async(["sh", "-c", "echo $VALUE"], add_env={"VALUE": "1"}) == "1"
+
+
+def _alive(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            # Killed orphan may stay a zombie until it is reaped by init
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+async def test_cancel_async(tmp_path: Path) -> None:
+    pid_path = tmp_path / "pid"
+    # Child process of the shell must be killed too
+    task = asyncio.ensure_future(run_async(["sh", "-c", f"sleep 10 & echo $! > {pid_path}; wait"], quiet=True))
+    outer = asyncio.ensure_future(with_background(task, forever()))
+    while not pid_path.exists() or pid_path.read_text() == "":
+        assert not task.done()
+        await asyncio.sleep(0.05)
+    await cancel_and_wait(outer)
+    assert task.cancelled()
+    await asyncio.sleep(0.1)
+    assert not _alive(int(pid_path.read_text()))
+
+
+async def test_timeout_async() -> None:
+    with pytest.raises(subprocess.TimeoutExpired):
+        await run_async(["sleep", "10"], timeout=0.5)
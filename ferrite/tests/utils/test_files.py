@@ -0,0 +1,108 @@
+from __future__ import annotations
+from typing import Dict
+
+import os
+from pathlib import Path
+
+from ferrite.utils.files import ConfigManifest, sync_sources, sync_tree
+
+
+def _write(root: Path, files: Dict[str, str]) -> None:
+    for path, text in files.items():
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / path).write_text(text)
+
+
+def _read(root: Path) -> Dict[str, str]:
+    return {str(path.relative_to(root)): path.read_text() for path in sorted(root.rglob("*")) if path.is_file()}
+
+
+def _dirs(root: Path) -> Dict[str, int]:
+    return {str(path.relative_to(root)): len(os.listdir(path)) for path in sorted(root.rglob("*")) if path.is_dir()}
+
+
+def test_sync_sources(tmp_path: Path) -> None:
+    src, dst, state = tmp_path / "src", tmp_path / "dst", tmp_path / "state.json"
+    _write(src, {"a": "a", "sub/b": "b", "conf": "conf"})
+
+    assert sorted(sync_sources(src, dst, state, exclude=[Path("conf")])) == [Path("a"), Path("sub/b")]
+    # Build outputs and modified files are kept
+    _write(dst, {"out": "out", "a": "modified"})
+    assert sync_sources(src, dst, state, exclude=[Path("conf")]) == []
+    assert _read(dst) == {"a": "modified", "out": "out", "sub/b": "b"}
+
+    _write(src, {"a": "a2"})
+    assert sync_sources(src, dst, state, exclude=[Path("conf")]) == [Path("a")]
+    assert _read(dst) == {"a": "a2", "out": "out", "sub/b": "b"}
+
+
+def test_sync_sources_type_change(tmp_path: Path) -> None:
+    src, dst, state = tmp_path / "src", tmp_path / "dst", tmp_path / "state.json"
+    _write(src, {"dir/a": "a", "deep/x/y": "y", "file": "file"})
+    sync_sources(src, dst, state)
+
+    # Directory becomes file and vice versa, the other directory is removed
+    (src / "dir" / "a").unlink()
+    (src / "dir").rmdir()
+    (src / "file").unlink()
+    (src / "deep" / "x" / "y").unlink()
+    (src / "deep" / "x").rmdir()
+    _write(src, {"dir": "dir", "file/b": "b"})
+
+    assert sorted(sync_sources(src, dst, state)) == [Path("deep/x/y"), Path("dir"), Path("dir/a"), Path("file"), Path("file/b")]
+    assert _read(dst) == {"dir": "dir", "file/b": "b"}
+    # Emptied directories are removed, the ones existing in sources are kept
+    assert _dirs(dst) == {"deep": 0, "file": 1}
+
+
+def test_sync_tree(tmp_path: Path) -> None:
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    _write(src, {"a": "a", "b": "b", "dir/c": "c", "old/d": "d"})
+    assert len(sync_tree(src, dst)) == 4
+    mtime = (dst / "a").stat().st_mtime_ns
+
+    (src / "b").unlink()
+    (src / "old" / "d").unlink()
+    (src / "old").rmdir()
+    (src / "dir" / "c").unlink()
+    (src / "dir").rmdir()
+    # Files become directories and vice versa
+    _write(src, {"b/e": "e", "dir": "dir"})
+
+    assert sorted(sync_tree(src, dst)) == [Path("b/e"), Path("dir"), Path("old"), Path("old/d")]
+    assert _read(dst) == {"a": "a", "b/e": "e", "dir": "dir"}
+    assert _dirs(dst) == {"b": 1}
+    # Unchanged files are not touched
+    assert (dst / "a").stat().st_mtime_ns == mtime
+
+
+def test_sync_tree_overlay(tmp_path: Path) -> None:
+    base, patch, dst = tmp_path / "base", tmp_path / "patch", tmp_path / "dst"
+    _write(base, {"a": "a", "b": "b"})
+    _write(patch, {"b": "patched", "c": "c"})
+    sync_tree([base, patch], dst)
+    assert _read(dst) == {"a": "a", "b": "patched", "c": "c"}
+
+
+def test_config_manifest(tmp_path: Path) -> None:
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    _write(src, {"conf/site": "A = 1\nB = 2\n"})
+    _write(dst, {"conf/site": "A = 1\nB = 2\n"})
+
+    config = ConfigManifest()
+    config.substitute([("^(A\\s*=).*$", "\\1 10")], "conf/site")
+    config.substitute([("^(B\\s*=).*$", "\\1 20")], "conf/site")
+    assert config.paths() == [Path("conf/site")]
+
+    assert config.apply(src, dst) == [Path("conf/site")]
+    assert (dst / "conf/site").read_text() == "A = 10\nB = 20\n"
+    # Pristine source is used, so applying again changes nothing
+    assert config.apply(src, dst) == []
+    assert (src / "conf/site").read_text() == "A = 1\nB = 2\n"
+
+    same = ConfigManifest()
+    same.substitute([("^(A\\s*=).*$", "\\1 10"), ("^(B\\s*=).*$", "\\1 20")], "conf/site")
+    other = ConfigManifest()
+    other.substitute([("^(A\\s*=).*$", "\\1 11"), ("^(B\\s*=).*$", "\\1 20")], "conf/site")
+    assert config.digest() == same.digest()
+    assert config.digest() != other.digest()
@@ -0,0 +1,147 @@
+from __future__ import annotations
+from typing import Any, Iterator, List, Optional, Tuple
+
+import os
+import re
+import json
+import time
+import socket
+import hashlib
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import urlopen
+
+import pytest
+
+from ferrite.utils import net
+from ferrite.utils.net import ChecksumError, download
+
+DATA = os.urandom(0x28000)
+SHA256 = hashlib.sha256(DATA).hexdigest()
+
+
+class _Server(ThreadingHTTPServer):
+
+    def __init__(self, ranges: bool = True, delay: float = 0.0) -> None:
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.ranges = ranges
+        self.delay = delay
+        self.requests: List[Optional[Tuple[int, int]]] = []
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/file"
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self) -> None:
+        server = self.server
+        assert isinstance(server, _Server)
+        time.sleep(server.delay)
+
+        match = re.fullmatch(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+        if server.ranges and match is not None:
+            start, end = int(match[1]), int(match[2]) + 1
+            server.requests.append((start, end))
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(DATA)}")
+        else:
+            start, end = 0, len(DATA)
+            server.requests.append(None)
+            self.send_response(200)
+        self.send_header("Content-Length", str(end - start))
+        self.end_headers()
+        self.wfile.write(DATA[start:end])
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+@contextmanager
+def _serve(ranges: bool = True, delay: float = 0.0) -> Iterator[_Server]:
+    server = _Server(ranges=ranges, delay=delay)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def _small_chunks(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(net, "CHUNK_SIZE", 0x8000)
+
+
+def _chunks(server: _Server) -> List[Tuple[int, int]]:
+    # Skip probe requests
+    return sorted([r for r in server.requests if r is not None and r != (0, 1)])
+
+
+def test_parallel_ranges(tmp_path: Path) -> None:
+    with _serve() as server:
+        download(server.url, tmp_path / "file", sha256=SHA256)
+    assert (tmp_path / "file").read_bytes() == DATA
+    assert _chunks(server) == [(i, i + 0x8000) for i in range(0, len(DATA), 0x8000)]
+    assert not (tmp_path / "file.part").exists()
+    assert not (tmp_path / "file.part.json").exists()
+
+
+def test_no_ranges(tmp_path: Path) -> None:
+    with _serve(ranges=False) as server:
+        download(server.url, tmp_path / "file", sha256=SHA256)
+    assert (tmp_path / "file").read_bytes() == DATA
+
+
+def test_fastest_mirror(tmp_path: Path) -> None:
+    with _serve(delay=0.5) as slow, _serve() as fast:
+        download([slow.url, "http://127.0.0.1:1/file", fast.url], tmp_path / "file", sha256=SHA256)
+    assert (tmp_path / "file").read_bytes() == DATA
+    assert len(_chunks(slow)) == 0
+    assert len(_chunks(fast)) == 5
+
+
+def test_unresponsive_mirror(tmp_path: Path) -> None:
+    # Accepts connections (by backlog) but never responds
+    with socket.socket() as hanging, _serve() as server:
+        hanging.bind(("127.0.0.1", 0))
+        hanging.listen()
+        hanging_url = f"http://127.0.0.1:{hanging.getsockname()[1]}/file"
+        start = time.monotonic()
+        download([hanging_url, server.url], tmp_path / "file", sha256=SHA256)
+        assert time.monotonic() - start < 5.0
+    assert (tmp_path / "file").read_bytes() == DATA
+
+
+def test_resume(tmp_path: Path) -> None:
+    done = [(0, 0x8000), (0x10000, 0x18000)]
+    part = bytearray(len(DATA))
+    for start, end in done:
+        part[start:end] = DATA[start:end]
+    (tmp_path / "file.part").write_bytes(part)
+    (tmp_path / "file.part.json").write_text(json.dumps({"size": len(DATA), "done": done}))
+
+    with _serve() as server:
+        download(server.url, tmp_path / "file", sha256=SHA256)
+    assert (tmp_path / "file").read_bytes() == DATA
+    assert _chunks(server) == [(0x8000, 0x10000), (0x18000, 0x20000), (0x20000, 0x28000)]
+
+
+def test_checksum_mismatch(tmp_path: Path) -> None:
+    with _serve() as server:
+        with pytest.raises(ChecksumError):
+            download(server.url, tmp_path / "file", sha256="00" * 32)
+    assert not (tmp_path / "file").exists()
+    assert not (tmp_path / "file.part").exists()
+
+
+def test_hashing_reader_tee(tmp_path: Path) -> None:
+    with _serve() as server, urlopen(server.url) as src, open(tmp_path / "copy", "wb") as tee:
+        reader = net.HashingReader(src, tee=tee)
+        assert len(reader.read(0x1000)) == 0x1000
+        reader.verify(SHA256)
+    assert (tmp_path / "copy").read_bytes() == DATA
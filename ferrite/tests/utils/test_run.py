@@ -0,0 +1,78 @@
+from __future__ import annotations
+from typing import List
+
+import os
+import sys
+import time
+import threading
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from ferrite.utils import run as run_module
+from ferrite.utils.run import RunError, capture, jobserver, log_output, run, stop_processes
+
+_PRINT_LINES = "import sys\nfor i in range(1000): print(f'line {i}')\nsys.exit(int(sys.argv[1]))"
+
+
+def test_stream_to_log(tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    lines: List[str] = []
+    with log_output(tmp_path / "logs" / "task.log") as log_path:
+        run([sys.executable, "-c", _PRINT_LINES, "0"], quiet=True, on_line=lines.append)
+    assert lines == [f"line {i}" for i in range(1000)]
+    assert log_path.read_text().splitlines() == lines
+    assert capsys.readouterr().out == ""
+
+
+def test_tail_on_failure(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]) -> None:
+    monkeypatch.setattr(run_module, "TAIL_LINES", 10)
+    with log_output(tmp_path / "task.log") as log_path:
+        with pytest.raises(RunError) as e:
+            run([sys.executable, "-c", _PRINT_LINES, "3"], quiet=True)
+    assert e.value.returncode == 3
+    assert e.value.output.decode().splitlines() == [f"line {i}" for i in range(990, 1000)]
+    assert len(log_path.read_text().splitlines()) == 1000
+    out = capsys.readouterr().out
+    assert str(log_path) in out and "line 999" in out and "line 989" not in out
+
+
+def test_timeout() -> None:
+    with pytest.raises(subprocess.TimeoutExpired):
+        run([sys.executable, "-c", "import time; print('started', flush=True); time.sleep(10)"], quiet=True, timeout=0.5)
+
+
+def test_jobserver_limits_make(tmp_path: Path) -> None:
+    (tmp_path / "Makefile").write_text("all: a b c d\na b c d:\n\t@echo +; sleep 0.2; echo -\n")
+    lines: List[str] = []
+    with jobserver(2) as server:
+        run(["make"], cwd=tmp_path, quiet=True, on_line=lines.append)
+        # All tokens are returned
+        os.set_blocking(server.read_fd, False)
+        assert len(os.read(server.read_fd, 16)) == 1
+    running = [sum([1 if line == "+" else -1 for line in lines[:i + 1]]) for i in range(len(lines))]
+    assert max(running) == 2
+    assert not server.fifo_path.exists()
+
+
+def test_stop_processes() -> None:
+    errors: List[BaseException] = []
+
+    def target() -> None:
+        try:
+            run(["sleep", "10"], quiet=True)
+        except RunError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    time.sleep(0.3)
+    start = time.monotonic()
+    with stop_processes():
+        thread.join()
+        # Processes started meanwhile are killed too
+        with pytest.raises(RunError):
+            run(["sleep", "10"])
+    assert time.monotonic() - start < 5.0
+    assert len(errors) == 1
+    assert capture(["echo", "ok"]) == "ok"
@@ -0,0 +1,120 @@
+from __future__ import annotations
+from typing import Dict, List, Tuple
+
+import os
+import time
+import shutil
+from pathlib import Path
+
+import pytest
+
+from ferrite.utils.scan import Scanner
+
+
+def _write(root: Path, files: Dict[str, str]) -> None:
+    for path, text in files.items():
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / path).write_text(text)
+
+
+# Moves modification time of the whole tree to the past, so that directory listings are not considered racy
+def _age(root: Path, seconds: float = 10.0) -> None:
+    past = time.time() - seconds
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            os.utime(os.path.join(dirpath, name), (past, past))
+        os.utime(dirpath, (past, past))
+
+
+def _count_listings(monkeypatch: pytest.MonkeyPatch, scanner: Scanner) -> List[str]:
+    listed: List[str] = []
+    original = scanner._list
+
+    def count(path: str) -> Tuple[List[str], List[str]]:
+        listed.append(os.path.basename(path))
+        return original(path)
+
+    monkeypatch.setattr(scanner, "_list", count)
+    return listed
+
+
+def test_cache_reuse(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    src, cache_path = tmp_path / "src", tmp_path / "scan.json"
+    _write(src, {"a": "a", "sub/b": "b", "sub/deep/c": "c"})
+    _age(src)
+
+    scanner = Scanner(cache_path=cache_path)
+    result = scanner.scan(src)
+    assert sorted(result.keys()) == ["a", "sub/b", "sub/deep/c"]
+    scanner.store()
+
+    # Unchanged directories are not listed again, even by a new scanner loaded from the cache
+    scanner = Scanner(cache_path=cache_path)
+    listed = _count_listings(monkeypatch, scanner)
+    assert scanner.scan(src) == result
+    assert listed == []
+
+    # Only the directory with a new entry is listed
+    _write(src, {"sub/new": "new"})
+    assert sorted(scanner.scan(src).keys()) == ["a", "sub/b", "sub/deep/c", "sub/new"]
+    assert listed == ["sub"]
+
+    # Cache of another mode is not used
+    assert Scanner(content=True, cache_path=cache_path).dirs == {}
+
+
+def test_recent_directory_is_listed(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    src = tmp_path / "src"
+    _write(src, {"a": "a"})
+    scanner = Scanner()
+    scanner.scan(src)
+    listed = _count_listings(monkeypatch, scanner)
+    # Directory is modified too recently to trust its cached listing
+    scanner.scan(src)
+    assert listed == ["src"]
+
+
+def test_removed_directory(tmp_path: Path) -> None:
+    src = tmp_path / "src"
+    _write(src, {"a": "a", "sub/b": "b", "sub/deep/c": "c"})
+    scanner = Scanner()
+    scanner.scan(src)
+    assert sorted([os.path.relpath(path, src) for path in scanner.dirs.keys()]) == [".", "sub", "sub/deep"]
+
+    shutil.rmtree(src / "sub")
+    assert list(scanner.scan(src).keys()) == ["a"]
+    assert list(scanner.dirs.keys()) == [str(src)]
+    assert scanner.scan(tmp_path / "missing") == {}
+
+
+def test_ignore(tmp_path: Path) -> None:
+    src = tmp_path / "src"
+    _write(src, {"a": "a", ".git/HEAD": "ref", "O.linux-x86_64/a.o": "", "sub/__pycache__/a.pyc": ""})
+    assert list(Scanner().scan(src).keys()) == ["a"]
+    assert sorted(Scanner(ignore=[]).scan(src).keys()) == [".git/HEAD", "O.linux-x86_64/a.o", "a", "sub/__pycache__/a.pyc"]
+
+
+def test_content_and_mtime(tmp_path: Path) -> None:
+    src = tmp_path / "src"
+    _write(src, {"a": "a", "sub/b": "b"})
+    _age(src)
+    stat_scanner, content_scanner = Scanner(), Scanner(content=True)
+    stat_digest, content_digest = stat_scanner.digest(src), content_scanner.digest(src)
+
+    # Touched file changes only the digest in stat mode
+    os.utime(src / "a")
+    assert stat_scanner.digest(src) != stat_digest
+    assert content_scanner.digest(src) == content_digest
+    stat_digest = stat_scanner.digest(src)
+
+    # Changes that keep size and modification time are not noticed (digests are cached by them)
+    mtime = (src / "a").stat().st_mtime_ns
+    (src / "a").write_text("A")
+    os.utime(src / "a", ns=(mtime, mtime))
+    assert stat_scanner.digest(src) == stat_digest
+    assert content_scanner.digest(src) == content_digest
+
+    # Digest is recomputed once modification time changes
+    os.utime(src / "a")
+    assert stat_scanner.digest(src) != stat_digest
+    assert content_scanner.digest(src) != content_digest
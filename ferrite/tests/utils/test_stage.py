@@ -0,0 +1,48 @@
+from __future__ import annotations
+from typing import Dict
+
+import shutil
+from pathlib import Path
+
+from ferrite.utils.stage import stage_tree
+
+
+def _write(root: Path, files: Dict[str, str]) -> None:
+    for path, text in files.items():
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / path).write_text(text)
+
+
+def _read(root: Path) -> Dict[str, str]:
+    return {str(path.relative_to(root)): path.read_text() for path in sorted(root.rglob("*")) if path.is_file()}
+
+
+def test_stage_tree(tmp_path: Path) -> None:
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    _write(src, {"a": "a", "ioc/st.cmd": "st", "ioc/Makefile": "make"})
+    ignore = shutil.ignore_patterns("Makefile")
+
+    assert stage_tree(src, dst, ignore=ignore) == 2
+    assert _read(dst) == {"a": "a", "ioc/st.cmd": "st"}
+    # Unchanged files are skipped
+    assert stage_tree(src, dst, ignore=ignore) == 0
+
+    _write(src, {"a": "changed"})
+    assert stage_tree(src, dst, ignore=ignore) == 1
+    assert _read(dst) == {"a": "changed", "ioc/st.cmd": "st"}
+
+
+def test_stage_tree_prune(tmp_path: Path) -> None:
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    _write(src, {"a": "a", "old/st.cmd": "st", "ioc/st.cmd": "st"})
+    stage_tree(src, dst)
+
+    shutil.rmtree(src / "old")
+    (src / "a").unlink()
+    # File becomes a directory
+    _write(src, {"a/b": "b", "ioc/Makefile": "make"})
+    _write(dst, {"ioc/stale": "stale"})
+
+    assert stage_tree(src, dst, ignore=shutil.ignore_patterns("Makefile"), prune=True) == 1
+    assert _read(dst) == {"a/b": "b", "ioc/st.cmd": "st"}
+    assert sorted([str(path.relative_to(dst)) for path in dst.iterdir()]) == ["a", "ioc"]
@@ -0,0 +1,86 @@
+from __future__ import annotations
+from typing import IO, List, Optional, Protocol, cast
+
+import shutil
+import tarfile
+import threading
+import subprocess
+from pathlib import Path
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Parallel decompressors that read stdin and write to stdout, in order of preference
+_DECOMPRESSORS = {
+    ".xz": [["xz", "--decompress", "--stdout", "--threads=0"]],
+    ".bz2": [["lbzip2", "--decompress", "--stdout"], ["pbzip2", "-d", "-c"]],
+    ".gz": [["pigz", "--decompress", "--stdout"]],
+}
+
+_CHUNK_SIZE = 0x100000
+
+
+class Reader(Protocol):
+
+    def read(self, size: int = -1) -> bytes:
+        ...
+
+
+def _find_decompressor(name: str) -> Optional[List[str]]:
+    for cmd in _DECOMPRESSORS.get(Path(name).suffix, []):
+        if shutil.which(cmd[0]) is not None:
+            return cmd
+    return None
+
+
+def _extract_with(cmd: List[str], src: Reader, dst_dir: Path) -> None:
+    logger.debug(f"decompressing with {cmd}")
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    assert proc.stdin is not None and proc.stdout is not None
+    feed_error: List[BaseException] = []
+
+    # Source is read in separate thread, so downloading, decompression and unpacking overlap
+    def feed() -> None:
+        assert proc.stdin is not None
+        try:
+            for chunk in iter(lambda: src.read(_CHUNK_SIZE), b""):
+                proc.stdin.write(chunk)
+        except BrokenPipeError:
+            pass
+        except BaseException as e:
+            feed_error.append(e)
+        finally:
+            proc.stdin.close()
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    try:
+        with tarfile.open(fileobj=proc.stdout, mode="r|") as tar:
+            tar.extractall(dst_dir)
+        # Trailing padding
+        while len(proc.stdout.read(_CHUNK_SIZE)) > 0:
+            pass
+    except BaseException:
+        proc.kill()
+        raise
+    finally:
+        proc.stdout.close()
+        feeder.join()
+        proc.wait()
+
+    if len(feed_error) > 0:
+        raise feed_error[0]
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+
+# Unpacks compressed tar archive while reading it from `src` (without storing the archive itself).
+# `name` is the archive file name used to detect compression.
+def extract_stream(src: Reader, name: str, dst_dir: Path) -> None:
+    cmd = _find_decompressor(name)
+    if cmd is not None:
+        _extract_with(cmd, src, dst_dir)
+    else:
+        with tarfile.open(fileobj=cast(IO[bytes], src), mode="r|*") as tar:
+            tar.extractall(dst_dir)
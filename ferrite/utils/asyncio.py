@@ -1,9 +1,22 @@
 from __future__ import annotations
-from typing import Any, Awaitable, TypeVar
+from typing import Any, Awaitable, Deque, Dict, List, Optional, TypeVar
 
+import os
+import sys
+import signal
 import asyncio
+import subprocess
+from pathlib import Path
+from collections import deque
+from contextlib import nullcontext
 from asyncio import CancelledError, ensure_future
 
+from ferrite.utils.run import TAIL_LINES, LineCallback, RunError, current_log_path, print_tail, process_env
+
+import logging
+
+logger = logging.getLogger(__name__)
+
 T = TypeVar("T")
 
 
@@ -47,3 +60,101 @@ async def with_background(
         await cancel_and_wait(fore_task)
         await cancel_and_wait(back_task)
         raise
+
+
+# Maximum length of an output line read by `run_async`
+_LINE_LIMIT = 0x100000
+
+
+def _kill_group(proc: asyncio.subprocess.Process) -> None:
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+async def _reap(proc: asyncio.subprocess.Process) -> None:
+    # The process is killed, so waiting is short, but the caller may try to cancel it repeatedly (see `cancel_and_wait`)
+    while proc.returncode is None:
+        try:
+            await proc.wait()
+        except CancelledError:
+            pass
+
+
+# Asynchronous counterpart of `run` with the same semantics.
+# The process is started in its own process group, and the whole group is killed on timeout or cancellation.
+async def run_async(
+    cmd: List[str | Path],
+    cwd: Optional[Path] = None,
+    add_env: Optional[Dict[str, str]] = None,
+    capture: bool = False,
+    quiet: bool = False,
+    timeout: Optional[float] = None,
+    on_line: Optional[LineCallback] = None,
+) -> Optional[str]:
+    logger.debug(f"run_async({cmd}, cwd={cwd})")
+    env, pass_fds = process_env(add_env)
+    echo = not capture and not quiet
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        cwd=cwd,
+        env=env,
+        pass_fds=pass_fds,
+        stdout=(subprocess.PIPE if not echo or on_line is not None else None),
+        stderr=(subprocess.STDOUT if quiet else None),
+        start_new_session=True,
+        limit=_LINE_LIMIT,
+    )
+
+    log_path = current_log_path() if quiet and not capture else None
+    # Whole output is kept only if it is captured
+    output: Deque[bytes] = deque(maxlen=(None if capture else TAIL_LINES))
+
+    async def communicate() -> None:
+        if proc.stdout is not None:
+            with (open(log_path, "ab") if log_path is not None else nullcontext()) as log:
+                async for line in proc.stdout:
+                    output.append(line)
+                    if log is not None:
+                        log.write(line)
+                    if echo:
+                        sys.stdout.buffer.write(line)
+                        sys.stdout.flush()
+                    if on_line is not None:
+                        on_line(line.decode("utf-8", errors="replace").rstrip("\n"))
+        await proc.wait()
+
+    try:
+        await asyncio.wait_for(communicate(), timeout)
+    except asyncio.TimeoutError:
+        _kill_group(proc)
+        await _reap(proc)
+        raise subprocess.TimeoutExpired(cmd, timeout or 0.0, output=b"".join(output))
+    except BaseException:
+        _kill_group(proc)
+        await _reap(proc)
+        raise
+
+    assert proc.returncode is not None
+    if proc.returncode != 0:
+        if capture:
+            sys.stdout.buffer.write(b"".join(output))
+        elif quiet:
+            print_tail(cmd, output, log_path)
+        raise RunError(proc.returncode, cmd, output=b"".join(output))
+
+    if capture:
+        return b"".join(output).decode("utf-8")
+    else:
+        return None
+
+
+async def capture_async(
+    cmd: List[str | Path],
+    cwd: Optional[Path] = None,
+    add_env: Optional[Dict[str, str]] = None,
+) -> str:
+    result = await run_async(cmd, cwd, add_env=add_env, capture=True)
+    assert result is not None
+    return result.strip()
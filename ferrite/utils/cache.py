@@ -0,0 +1,66 @@
+from __future__ import annotations
+from typing import Dict, List
+
+import os
+import json
+import shutil
+from pathlib import Path
+
+from ferrite.utils.run import capture
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def cache_dir() -> Path:
+    path = os.environ.get("FERRITE_CACHE_DIR")
+    if path is not None:
+        return Path(path)
+    xdg_path = os.environ.get("XDG_CACHE_HOME")
+    if xdg_path is not None:
+        return Path(xdg_path) / "ferrite"
+    return Path.home() / ".cache" / "ferrite"
+
+
+def _load_probes(path: Path) -> Dict[str, str]:
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    return {str(k): str(v) for k, v in data.items()}
+
+
+def _store_probes(path: Path, probes: Dict[str, str]) -> None:
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(probes, f, indent=2, sort_keys=True)
+        tmp_path.replace(path)
+    except OSError as e:
+        logger.debug(f"Cannot store probe cache '{path}': {e}")
+
+
+# Runs the command and caches its output on disk.
+# Cache is invalidated when the executable is replaced (i.e. its path or modification time changes).
+def cached_capture(cmd: List[str]) -> str:
+    exe = shutil.which(cmd[0])
+    if exe is None:
+        return capture([*cmd])
+
+    stat = os.stat(exe)
+    key = json.dumps([os.path.realpath(exe), stat.st_mtime_ns, stat.st_size, *cmd[1:]])
+
+    path = cache_dir() / "probes.json"
+    probes = _load_probes(path)
+    try:
+        return probes[key]
+    except KeyError:
+        pass
+
+    output = capture([*cmd])
+    probes[key] = output
+    _store_probes(path, probes)
+    return output
@@ -1,9 +1,18 @@
 from __future__ import annotations
-from typing import Callable, List, Optional, Set, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
 
+import os
+import stat
+import fcntl
+import fnmatch
 import re
+import json
 import shutil
+import hashlib
 from pathlib import Path
+from contextlib import contextmanager
+
+from ferrite.utils.stage import stage_files
 
 import logging
 
@@ -36,6 +45,55 @@ def substitute(
         logger.debug(f"file unchanged '{dst}'")
 
 
+# Returns `True` if the file was written.
+def write_if_changed(path: Path, text: str) -> bool:
+    try:
+        with open(path, "r") as f:
+            if f.read() == text:
+                return False
+    except FileNotFoundError:
+        pass
+    # Readers never see partially written file
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    if path.exists():
+        shutil.copymode(path, tmp_path)
+    tmp_path.replace(path)
+    return True
+
+
+# Substitutions for several files collected to be applied at once.
+class ConfigManifest:
+
+    def __init__(self) -> None:
+        # Relative path -> list of (pattern, replacement)
+        self.files: Dict[str, List[Tuple[str, str]]] = {}
+
+    def substitute(self, rep: List[Tuple[str, str]], path: str) -> None:
+        self.files.setdefault(path, []).extend(rep)
+
+    def paths(self) -> List[Path]:
+        return [Path(path) for path in self.files.keys()]
+
+    def digest(self) -> str:
+        return digest(self.files)
+
+    # Applies substitutions to the pristine files from `src_dir` and writes results to `dst_dir`.
+    # File is written only if its final content differs. Returns relative paths of written files.
+    def apply(self, src_dir: Path, dst_dir: Path) -> List[Path]:
+        changed: List[Path] = []
+        for path, rep in self.files.items():
+            with open(src_dir / path, "r") as f:
+                data = f.read()
+            for pattern, repl in [(re.compile(s, flags=re.M), d) for s, d in rep]:
+                data = pattern.sub(repl, data)
+            if write_if_changed(dst_dir / path, data):
+                logger.debug(f"configured '{dst_dir / path}'")
+                changed.append(Path(path))
+        return changed
+
+
 def _inverse_ignore_patterns(ignore_patterns: Callable[[str, List[str]], Set[str]]) -> Callable[[str, List[str]], Set[str]]:
 
     def allow_patterns(path: str, names: List[str]) -> Set[str]:
@@ -46,3 +104,196 @@ def _inverse_ignore_patterns(ignore_patterns: Callable[[str, List[str]], Set[str
 
 def allow_patterns(*patterns: str) -> Callable[[str, List[str]], Set[str]]:
     return _inverse_ignore_patterns(shutil.ignore_patterns(*patterns))
+
+
+def file_digest(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(0x10000), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _same_file(src: Path, src_stat: os.stat_result, dst: Path) -> bool:
+    try:
+        dst_stat = dst.stat()
+    except (FileNotFoundError, NotADirectoryError):
+        return False
+    if not stat.S_ISREG(dst_stat.st_mode):
+        return False
+    if src_stat.st_size != dst_stat.st_size:
+        return False
+    if src_stat.st_mtime_ns == dst_stat.st_mtime_ns:
+        return True
+    return file_digest(src) == file_digest(dst)
+
+
+def _ignored(name: str, ignore: List[str]) -> bool:
+    return any([fnmatch.fnmatch(name, pattern) for pattern in ignore])
+
+
+# Returns files by their relative paths and all relative directory paths.
+# Files from later sources override the ones with the same path from former sources.
+def _collect_tree(srcs: List[Path], ignore: List[str]) -> Tuple[Dict[Path, Path], Set[Path]]:
+    files: Dict[Path, Path] = {}
+    dirs: Set[Path] = set()
+    for src in srcs:
+        for dirpath, dirnames, filenames in os.walk(src, followlinks=True):
+            dirnames[:] = [name for name in dirnames if not _ignored(name, ignore)]
+            rel_dir = Path(dirpath).relative_to(src)
+            dirs.add(rel_dir)
+            for name in filenames:
+                if not _ignored(name, ignore):
+                    files[rel_dir / name] = Path(dirpath, name)
+    return (files, dirs)
+
+
+# Creates directory `root / rel_dir` removing files that are in the way (e.g. the source file has become a directory).
+def _make_dir(root: Path, rel_dir: Path) -> None:
+    path = root
+    for part in rel_dir.parts:
+        path = path / part
+        if path.is_symlink() or (path.exists() and not path.is_dir()):
+            logger.debug(f"removing '{path}'")
+            path.unlink()
+    (root / rel_dir).mkdir(parents=True, exist_ok=True)
+
+
+# Removes file and then its parent directories up to `root` that became empty and are not in `keep`.
+def _remove(root: Path, rel_path: Path, keep: Set[Path]) -> None:
+    path = root / rel_path
+    logger.debug(f"removing '{path}'")
+    try:
+        if path.is_dir() and not path.is_symlink():
+            shutil.rmtree(path)
+        else:
+            path.unlink()
+    except (FileNotFoundError, NotADirectoryError):
+        # Parent is already removed or replaced by file
+        return
+    for rel_dir in rel_path.parents:
+        if rel_dir == Path(".") or rel_dir in keep:
+            break
+        try:
+            (root / rel_dir).rmdir()
+        except OSError:
+            break
+
+
+def _copy(root: Path, pairs: List[Tuple[Path, Path]]) -> None:
+    for src_path, dst_path in pairs:
+        logger.debug(f"copying '{src_path}' -> '{dst_path}'")
+        if dst_path.is_dir() and not dst_path.is_symlink():
+            shutil.rmtree(dst_path)
+        _make_dir(root, dst_path.parent.relative_to(root))
+    stage_files(pairs)
+
+
+# Makes `dst` directory contents the same as contents of `src` (or of several `src` directories laid over each other).
+# Only changed files are copied, unchanged files are left untouched (so their modification time is preserved),
+# files missing in `src` are removed from `dst`. Returns relative paths of copied and removed files and directories.
+def sync_tree(src: Path | List[Path], dst: Path, ignore: List[str] = []) -> List[Path]:
+    files, dirs = _collect_tree(src if isinstance(src, list) else [src], ignore)
+    changed: List[Path] = []
+
+    for rel_path, src_path in sorted(files.items()):
+        if not _same_file(src_path, src_path.stat(), dst / rel_path):
+            changed.append(rel_path)
+    _copy(dst, [(files[rel_path], dst / rel_path) for rel_path in changed])
+    for rel_dir in dirs:
+        _make_dir(dst, rel_dir)
+
+    for dirpath, dirnames, filenames in os.walk(dst, topdown=False):
+        rel_dir = Path(dirpath).relative_to(dst)
+        for name in [*filenames, *dirnames]:
+            rel_path = rel_dir / name
+            if rel_path in files or rel_path in dirs or _ignored(name, ignore):
+                continue
+            path = dst / rel_path
+            logger.debug(f"removing '{path}'")
+            if path.is_dir() and not path.is_symlink():
+                shutil.rmtree(path)
+            else:
+                path.unlink()
+            changed.append(rel_path)
+
+    return changed
+
+
+# Copies source files to the build directory `dst` that may also contain build outputs and modified (configured) files.
+# Source file is copied only if it is changed since the previous sync (according to the state stored in `state_path`),
+# so the files modified in `dst` are kept until their sources change. Modification time of the sources is preserved.
+# Files synced before and removed from the sources are removed from `dst`, other files in `dst` are left untouched.
+# Files from `exclude` (relative paths) are not synced at all.
+def sync_sources(
+    src: Path | List[Path],
+    dst: Path,
+    state_path: Path,
+    ignore: List[str] = [],
+    exclude: List[Path] = [],
+) -> List[Path]:
+    try:
+        with open(state_path, "r") as f:
+            state = {Path(k): v for k, v in json.load(f).items()}
+    except (FileNotFoundError, ValueError):
+        state = {}
+
+    files, dirs = _collect_tree(src if isinstance(src, list) else [src], ignore)
+    for rel_path in exclude:
+        files.pop(rel_path, None)
+        state.pop(rel_path, None)
+    changed: List[Path] = []
+    new_state: Dict[Path, List[int]] = {}
+
+    # Removed first, so that the paths can be reused by directories
+    for rel_path in state.keys():
+        if rel_path not in files:
+            _remove(dst, rel_path, dirs)
+            changed.append(rel_path)
+
+    copied: List[Path] = []
+    for rel_path, src_path in sorted(files.items()):
+        src_stat = src_path.stat()
+        new_state[rel_path] = [src_stat.st_mtime_ns, src_stat.st_size]
+        dst_path = dst / rel_path
+        if state.get(rel_path) == new_state[rel_path] and dst_path.is_file():
+            continue
+        if not _same_file(src_path, src_stat, dst_path):
+            copied.append(rel_path)
+    _copy(dst, [(files[rel_path], dst / rel_path) for rel_path in copied])
+    changed.extend(copied)
+    for rel_dir in dirs:
+        _make_dir(dst, rel_dir)
+
+    tmp_path = state_path.with_name(f"{state_path.name}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump({str(k): v for k, v in new_state.items()}, f)
+    tmp_path.replace(state_path)
+
+    return changed
+
+
+# Digest of JSON-serializable data
+def digest(data: Any) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# Exclusive lock shared between processes (e.g. concurrent builds using the same cache).
+@contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    with open(path, "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def read_stamp(path: Path) -> Optional[str]:
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def write_stamp(path: Path, value: str) -> None:
+    with open(path, "w") as f:
+        f.write(value + "\n")
@@ -1,43 +1,306 @@
 from __future__ import annotations
-from typing import List, Tuple
+from typing import IO, Callable, List, Optional, Tuple
 
+import os
+import json
+import time
+import queue
+import hashlib
+import threading
 from pathlib import Path
-from urllib.request import urlretrieve
-from urllib.error import HTTPError, URLError
+from dataclasses import dataclass
+from http.client import HTTPException
+from urllib.request import Request, urlopen
+from urllib.error import URLError
+from concurrent.futures import ThreadPoolExecutor
 
+from ferrite.utils.files import file_digest
 from ferrite.utils.progress import DownloadBar
 
 import logging
 
 logger = logging.getLogger(__name__)
 
+TIMEOUT = 30.0
+# Size of a range requested by a single connection
+CHUNK_SIZE = 0x800000
+CONNECTIONS = 4
+# Time to wait for other mirrors after the first one has responded
+PROBE_GRACE = 0.5
 
-def download(src_url: str, dst_path: Path) -> None:
-    logger.debug(f"downloading from '{src_url}' ...")
-    bar = DownloadBar()
-    bar.print()
-    try:
-        urlretrieve(src_url, dst_path, bar.update_by_blocks_and_print)
-    except RuntimeError:
-        print(flush=True)
-        dst_path.unlink(missing_ok=True)
-        logger.warning(f"download failed")
-        raise
-    bar.current_bytes = bar.total_bytes
-    bar.print()
-    print(flush=True)
-    logger.debug(f"downloaded to '{dst_path}'")
+_BLOCK_SIZE = 0x10000
+
+# Network errors that are worth trying another mirror after
+NetError = (OSError, HTTPException)
+
+
+class ChecksumError(RuntimeError):
+    pass
+
+
+# Reader that computes SHA-256 of passed data and optionally copies it to `tee`.
+class HashingReader:
+
+    def __init__(
+        self,
+        src: IO[bytes],
+        tee: Optional[IO[bytes]] = None,
+        on_read: Optional[Callable[[int], None]] = None,
+    ) -> None:
+        self.src = src
+        self.tee = tee
+        self.on_read = on_read
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.src.read(size)
+        self.hasher.update(data)
+        if self.tee is not None:
+            self.tee.write(data)
+        self.size += len(data)
+        if self.on_read is not None:
+            self.on_read(self.size)
+        return data
+
+    # Reads the rest of the source and checks its digest.
+    def verify(self, sha256: Optional[str]) -> None:
+        while len(self.read(0x100000)) > 0:
+            pass
+        _check_digest(self.hasher.hexdigest(), sha256)
+
+
+def _check_digest(digest: str, sha256: Optional[str]) -> None:
+    if sha256 is not None and digest != sha256.lower():
+        raise ChecksumError(f"SHA-256 mismatch: expected {sha256}, got {digest}")
+
+
+@dataclass
+class Probe:
+    url: str
+    # Time to receive response headers
+    latency: float
+    size: Optional[int]
+    ranges: bool
 
 
-def download_alt(src_urls: List[str], dst_path: Path) -> None:
+def _probe(url: str, timeout: float) -> Probe:
+    start = time.monotonic()
+    # Request the first byte only to find out whether the server supports ranges
+    with urlopen(Request(url, headers={"Range": "bytes=0-0"}), timeout=timeout) as response:
+        latency = time.monotonic() - start
+        if response.status == 206:
+            total = response.headers.get("Content-Range", "").rsplit("/", 1)[-1]
+            return Probe(url, latency, int(total) if total.isdigit() else None, True)
+        length = response.headers.get("Content-Length")
+        return Probe(url, latency, int(length) if length is not None else None, False)
+
+
+# Probes all mirrors concurrently. Returns available ones, the best first.
+# Waits for the first mirror to respond and then at most `grace` seconds more for the others,
+# so a mirror that doesn't respond doesn't delay the download. Mirrors that support ranges are preferred.
+def probe(src_urls: List[str], timeout: float = TIMEOUT, grace: float = PROBE_GRACE) -> List[Probe]:
+    results: queue.Queue[Probe | Exception] = queue.Queue()
+
+    def try_probe(url: str) -> None:
+        try:
+            results.put(_probe(url, timeout))
+        except NetError as e:
+            logger.warning(f"{url}: {e}")
+            results.put(e)
+
+    # Threads are not joined, so the ones waiting for unresponsive mirrors don't block
     for url in src_urls:
-        last_error = None
+        threading.Thread(target=try_probe, args=(url,), daemon=True).start()
+
+    probes: List[Probe] = []
+    errors: List[Exception] = []
+    deadline: Optional[float] = None
+    while len(probes) + len(errors) < len(src_urls):
         try:
-            download(url, dst_path)
+            result = results.get(timeout=(max(deadline - time.monotonic(), 0.0) if deadline is not None else None))
+        except queue.Empty:
             break
-        except (HTTPError, URLError) as e:
+        if isinstance(result, Probe):
+            probes.append(result)
+            if deadline is None:
+                deadline = time.monotonic() + grace
+        else:
+            errors.append(result)
+
+    if len(probes) == 0:
+        if len(errors) > 0:
+            raise errors[-1]
+        raise URLError("No URLs to download from")
+    probes.sort(key=lambda p: (not p.ranges, p.latency))
+    logger.debug(f"mirrors: {[(p.url, round(p.latency, 3)) for p in probes]}")
+    return probes
+
+
+# Opens the fastest available URL for reading. Returns the stream and its size if known.
+def open_alt(src_urls: List[str]) -> Tuple[IO[bytes], Optional[int]]:
+    last_error: Optional[BaseException] = None
+    for p in probe(src_urls):
+        logger.debug(f"opening '{p.url}' ...")
+        try:
+            return (urlopen(p.url, timeout=TIMEOUT), p.size)
+        except NetError as e:
             last_error = e
-            logger.warning(str(e))
-            continue
-    if last_error is not None:
+            logger.warning(f"{p.url}: {e}")
+    assert last_error is not None
+    raise last_error
+
+
+# Download state stored next to `.part` file to resume the download.
+class _PartState:
+
+    def __init__(self, path: Path, size: int) -> None:
+        self.path = path
+        self.size = size
+        self.done: List[Tuple[int, int]] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def load(path: Path, size: int) -> Optional[_PartState]:
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            if data["size"] != size:
+                return None
+            state = _PartState(path, size)
+            state.done = [(int(a), int(b)) for a, b in data["done"]]
+            return state
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            return None
+
+    def complete(self, chunk: Tuple[int, int]) -> None:
+        with self._lock:
+            self.done.append(chunk)
+            tmp_path = self.path.with_name(f"{self.path.name}.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump({"size": self.size, "done": self.done}, f)
+            tmp_path.replace(self.path)
+
+    def done_bytes(self) -> int:
+        return sum([end - start for start, end in self.done])
+
+
+class _Progress:
+
+    def __init__(self, total: int, current: int = 0) -> None:
+        self.bar = DownloadBar(current_bytes=current, total_bytes=total)
+        self.current = current
+        self._lock = threading.Lock()
+
+    def add(self, size: int) -> None:
+        with self._lock:
+            self.current += size
+            self.bar.update_and_print(self.current)
+
+    def finish(self) -> None:
+        self.bar.current_bytes = self.bar.total_bytes
+        self.bar.print()
+        print(flush=True)
+
+
+def _fetch_range(url: str, fd: int, chunk: Tuple[int, int], progress: _Progress) -> None:
+    start, end = chunk
+    request = Request(url, headers={"Range": f"bytes={start}-{end - 1}"})
+    with urlopen(request, timeout=TIMEOUT) as response:
+        if response.status != 206:
+            raise HTTPException(f"Server does not respond with the requested range, status: {response.status}")
+        pos = start
+        while pos < end:
+            data = response.read(min(_BLOCK_SIZE, end - pos))
+            if len(data) == 0:
+                raise HTTPException(f"Range {start}-{end} is truncated at {pos}")
+            os.pwrite(fd, data, pos)
+            pos += len(data)
+            progress.add(len(data))
+
+
+def _download_ranges(p: Probe, part_path: Path, state_path: Path, connections: int) -> None:
+    assert p.size is not None
+    state = _PartState.load(state_path, p.size) if part_path.exists() else None
+    if state is None:
+        state = _PartState(state_path, p.size)
+        part_path.unlink(missing_ok=True)
+    else:
+        logger.info(f"Resuming download, {state.done_bytes()} of {p.size} bytes are already loaded")
+
+    done = set(state.done)
+    chunks = [(start, min(start + CHUNK_SIZE, p.size)) for start in range(0, p.size, CHUNK_SIZE)]
+    chunks = [chunk for chunk in chunks if chunk not in done]
+
+    progress = _Progress(p.size, state.done_bytes())
+    fd = os.open(part_path, os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        os.ftruncate(fd, p.size)
+
+        def fetch(chunk: Tuple[int, int]) -> None:
+            _fetch_range(p.url, fd, chunk, progress)
+            state.complete(chunk)
+
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            # Raises the first error after all started chunks are finished
+            for _ in executor.map(fetch, chunks):
+                pass
+    finally:
+        os.close(fd)
+    progress.finish()
+
+
+def _download_stream(p: Probe, part_path: Path) -> None:
+    progress = _Progress(p.size or 0)
+    with urlopen(p.url, timeout=TIMEOUT) as response, open(part_path, "wb") as f:
+        for data in iter(lambda: response.read(_BLOCK_SIZE), b""):
+            f.write(data)
+            progress.add(len(data))
+    progress.finish()
+
+
+# Downloads file from the fastest available mirror, falling back to the others on failure.
+# If the server supports ranges then the file is loaded by several connections in parallel,
+# and interrupted download is resumed from `<dst_path>.part` next time.
+def download(
+    src_urls: str | List[str],
+    dst_path: Path,
+    sha256: Optional[str] = None,
+    connections: int = CONNECTIONS,
+) -> None:
+    urls = [src_urls] if isinstance(src_urls, str) else src_urls
+    part_path = dst_path.with_name(f"{dst_path.name}.part")
+    state_path = dst_path.with_name(f"{dst_path.name}.part.json")
+
+    last_error: Optional[BaseException] = None
+    for p in probe(urls):
+        logger.debug(f"downloading from '{p.url}' ...")
+        try:
+            if p.ranges and p.size is not None:
+                _download_ranges(p, part_path, state_path, connections)
+            else:
+                _download_stream(p, part_path)
+            break
+        except NetError as e:
+            print(flush=True)
+            last_error = e
+            logger.warning(f"Download from '{p.url}' failed: {e}")
+    else:
+        assert last_error is not None
         raise last_error
+
+    try:
+        _check_digest(file_digest(part_path), sha256)
+    except ChecksumError:
+        # Corrupted data cannot be resumed
+        part_path.unlink()
+        state_path.unlink(missing_ok=True)
+        raise
+
+    part_path.replace(dst_path)
+    state_path.unlink(missing_ok=True)
+    logger.debug(f"downloaded to '{dst_path}'")
+
+
+def download_alt(src_urls: List[str], dst_path: Path, sha256: Optional[str] = None) -> None:
+    download(src_urls, dst_path, sha256=sha256)
@@ -86,6 +86,13 @@ class DownloadBar(ProgressBar):
             self.current_bytes = size
             self.print()
 
+    def update_and_print(self, current_bytes: int) -> None:
+        if self.total_bytes <= 0:
+            return
+        if self._should_update(current_bytes / self.total_bytes):
+            self.current_bytes = current_bytes
+            self.print()
+
 
 def _num_text_len(n: int) -> int:
     return len(str(n))
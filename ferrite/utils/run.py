@@ -1,10 +1,16 @@
 from __future__ import annotations
-from typing import List, Dict, Optional
+from typing import Any, Callable, Deque, Iterator, List, Dict, Optional, Set, Tuple
 
 import os
 import sys
+import shutil
+import tempfile
+import threading
 import subprocess
 from pathlib import Path
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
 
 RunError = subprocess.CalledProcessError
 
@@ -13,6 +19,232 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+# GNU make compatible jobserver.
+# Every client has one implicit job slot, so the pipe contains `jobs - 1` tokens.
+# The pipe is a named FIFO, so it can be passed both as file descriptors (make) and by path (make >= 4.4, Ninja >= 1.13).
+class Jobserver:
+
+    def __init__(self, jobs: int) -> None:
+        assert jobs >= 1
+        self.jobs = jobs
+        self.dir = Path(tempfile.mkdtemp(prefix="ferrite-jobserver-"))
+        self.fifo_path = self.dir / "fifo"
+        os.mkfifo(self.fifo_path)
+        # Opening for reading doesn't block because there is a writer already
+        self.write_fd = os.open(self.fifo_path, os.O_RDWR)
+        self.read_fd = os.open(self.fifo_path, os.O_RDONLY)
+        os.write(self.write_fd, b"+" * (self.jobs - 1))
+
+    @property
+    def fds(self) -> List[int]:
+        return [self.read_fd, self.write_fd]
+
+    def makeflags(self, fifo: bool = False) -> str:
+        if fifo:
+            return f" -j{self.jobs} --jobserver-auth=fifo:{self.fifo_path}"
+        fds = f"{self.read_fd},{self.write_fd}"
+        # `--jobserver-fds` is for make < 4.2
+        return f" -j{self.jobs} --jobserver-fds={fds} --jobserver-auth={fds}"
+
+    def close(self) -> None:
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+_jobserver: Optional[Jobserver] = None
+
+
+# Host jobserver for all processes started by `run` inside the context.
+# Make, CMake (with Make or Ninja >= 1.13) and nested builds share the job slots,
+# so the total build parallelism is limited by `jobs` even if several tasks are running.
+@contextmanager
+def jobserver(jobs: Optional[int] = None) -> Iterator[Jobserver]:
+    global _jobserver
+    if _jobserver is not None:
+        # Already hosted by the outer context
+        yield _jobserver
+        return
+
+    server = Jobserver(jobs if jobs is not None else (os.cpu_count() or 1))
+    logger.debug(f"jobserver started with {server.jobs} jobs")
+    _jobserver = server
+    try:
+        yield server
+    finally:
+        _jobserver = None
+        server.close()
+
+
+def active_jobserver() -> Optional[Jobserver]:
+    return _jobserver
+
+
+# Arguments to pass parallelism to a build tool.
+# When the jobserver is active the tool must not be given explicit number of jobs, otherwise it ignores jobserver.
+def jobs_args(flag: str, jobs: Optional[int] = None) -> List[str]:
+    if _jobserver is not None:
+        return []
+    return [flag, *([str(jobs)] if jobs is not None else [])]
+
+
+# Number of last output lines kept in memory to show on failure
+TAIL_LINES = 200
+
+LineCallback = Callable[[str], None]
+
+# Log file for output of processes run in the current context (e.g. the task being run).
+_log_path: ContextVar[Optional[Path]] = ContextVar("_log_path", default=None)
+
+_output_lock = threading.Lock()
+
+
+# Writes full output of processes started by `run` inside the context to `path` (the file is truncated first).
+# The context is local to the current thread, so concurrent tasks can log to separate files.
+@contextmanager
+def log_output(path: Path) -> Iterator[Path]:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"")
+    token = _log_path.set(path)
+    try:
+        yield path
+    finally:
+        _log_path.reset(token)
+
+
+# Log file set by the enclosing `log_output` context, if any
+def current_log_path() -> Optional[Path]:
+    return _log_path.get()
+
+
+# Processes started by `run` in all threads
+_processes: Set[subprocess.Popen[bytes]] = set()
+_processes_lock = threading.Lock()
+_stopping = False
+
+
+@contextmanager
+def _tracked(proc: subprocess.Popen[bytes]) -> Iterator[subprocess.Popen[bytes]]:
+    with _processes_lock:
+        _processes.add(proc)
+        stopping = _stopping
+    try:
+        with proc:
+            if stopping:
+                proc.kill()
+            yield proc
+    finally:
+        with _processes_lock:
+            _processes.discard(proc)
+
+
+# Kills processes started by `run` in all threads, and the ones started until the context is left.
+# Used to stop tasks running in worker threads when the run is interrupted, so that the context can wait for them.
+@contextmanager
+def stop_processes() -> Iterator[None]:
+    global _stopping
+    with _processes_lock:
+        _stopping = True
+        processes = list(_processes)
+    for proc in processes:
+        logger.debug(f"killing process {proc.pid}")
+        proc.kill()
+    try:
+        yield
+    finally:
+        with _processes_lock:
+            _stopping = False
+
+
+# The same as `subprocess.run` but the process can be killed by `stop_processes`.
+def _run_process(cmd: List[str | Path], timeout: Optional[float], **popen_args: Any) -> Tuple[int, Optional[bytes]]:
+    with _tracked(subprocess.Popen(cmd, **popen_args)) as proc:
+        try:
+            output, _ = proc.communicate(timeout=timeout)
+        except BaseException:
+            proc.kill()
+            raise
+    return (proc.returncode, output)
+
+
+# Environment and file descriptors to pass to a process (shared with `ferrite.utils.asyncio`)
+def process_env(add_env: Optional[Dict[str, str]]) -> Tuple[Dict[str, str], List[int]]:
+    env = dict(os.environ)
+    pass_fds: List[int] = []
+    if _jobserver is not None:
+        env["MAKEFLAGS"] = _jobserver.makeflags()
+        pass_fds = _jobserver.fds
+    if add_env:
+        env.update(add_env)
+        logger.debug(f"additional env: {add_env}")
+    return (env, pass_fds)
+
+
+# Shows the last lines of output of the failed process
+def print_tail(cmd: List[str | Path], tail: Deque[bytes], log_path: Optional[Path]) -> None:
+    with _output_lock:
+        if log_path is not None:
+            print(f"Last {len(tail)} line(s) of output of {cmd}, full output is in '{log_path}':", flush=True)
+        sys.stdout.buffer.write(b"".join(tail))
+        sys.stdout.flush()
+
+
+# Reads output line by line, so it is never stored entirely.
+def _stream(
+    cmd: List[str | Path],
+    popen_args: Dict[str, Any],
+    echo: bool,
+    on_line: Optional[LineCallback],
+    timeout: Optional[float],
+) -> None:
+    log_path = current_log_path()
+    tail: Deque[bytes] = deque(maxlen=TAIL_LINES)
+    with ExitStack() as stack:
+        log = stack.enter_context(open(log_path, "ab")) if log_path is not None else None
+        proc = stack.enter_context(
+            _tracked(subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, **popen_args))
+        )
+        assert proc.stdout is not None
+
+        timed_out = threading.Event()
+
+        def kill() -> None:
+            timed_out.set()
+            proc.kill()
+
+        timer: Optional[threading.Timer] = None
+        if timeout is not None:
+            timer = threading.Timer(timeout, kill)
+            timer.start()
+        try:
+            for line in proc.stdout:
+                tail.append(line)
+                if log is not None:
+                    log.write(line)
+                if echo:
+                    sys.stdout.buffer.write(line)
+                    sys.stdout.flush()
+                if on_line is not None:
+                    on_line(line.decode("utf-8", errors="replace").rstrip("\n"))
+        except BaseException:
+            proc.kill()
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+        proc.wait()
+
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout or 0.0, output=b"".join(tail))
+    if proc.returncode != 0:
+        if not echo:
+            print_tail(cmd, tail, log_path)
+        # Only the tail of output is available
+        raise RunError(proc.returncode, cmd, output=b"".join(tail))
+
+
+# With `quiet` the output is not shown but written to the current log (see `log_output`),
+# and only its last `TAIL_LINES` lines are shown on failure. `on_line` is called for each output line.
 def run(
     cmd: List[str | Path],
     cwd: Optional[Path] = None,
@@ -20,40 +252,42 @@ def run(
     capture: bool = False,
     quiet: bool = False,
     timeout: Optional[float] = None,
+    on_line: Optional[LineCallback] = None,
 ) -> Optional[str]:
     logger.debug(f"run({cmd}, cwd={cwd})")
-    env = dict(os.environ)
-    if add_env:
-        env.update(add_env)
-        logger.debug(f"additional env: {add_env}")
+    env, pass_fds = process_env(add_env)
 
-    stdout = None
-    if capture or quiet:
-        stdout = subprocess.PIPE
-    stderr = None
-    if quiet:
-        stderr = subprocess.STDOUT
-
-    try:
-        ret = subprocess.run(
-            cmd,
-            check=True,
-            cwd=cwd,
-            env=env,
-            stdout=stdout,
-            stderr=stderr,
-            timeout=timeout,
-        )
-    except RunError as e:
-        if capture or quiet:
-            sys.stdout.buffer.write(e.output)
-        raise
-
-    if capture:
-        return ret.stdout.decode("utf-8")
-    else:
+    if not capture:
+        if quiet or on_line is not None:
+            _stream(
+                cmd,
+                dict(cwd=cwd, env=env, pass_fds=pass_fds),
+                echo=not quiet,
+                on_line=on_line,
+                timeout=timeout,
+            )
+        else:
+            returncode, _ = _run_process(cmd, timeout, cwd=cwd, env=env, pass_fds=pass_fds)
+            if returncode != 0:
+                raise RunError(returncode, cmd)
         return None
 
+    returncode, output = _run_process(
+        cmd,
+        timeout,
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=(subprocess.STDOUT if quiet else None),
+        pass_fds=pass_fds,
+    )
+    assert output is not None
+    if returncode != 0:
+        sys.stdout.buffer.write(output)
+        raise RunError(returncode, cmd, output=output)
+
+    return output.decode("utf-8")
+
 
 def capture(
     cmd: List[str | Path],
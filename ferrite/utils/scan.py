@@ -0,0 +1,177 @@
+from __future__ import annotations
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+import os
+import json
+import time
+import fnmatch
+from pathlib import Path
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+
+from ferrite.utils.files import digest, file_digest
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IGNORE = [".git", "__pycache__", "O.*"]
+
+# Directory listing is not trusted if the directory was modified this recently,
+# because further changes within the same timestamp granularity are indistinguishable.
+_RACY_NS = 2_000_000_000
+
+_CACHE_VERSION = 1
+
+# [modification time, size, content digest (in content mode)]
+_File = List[Union[int, str, None]]
+
+
+@dataclass
+class _Dir:
+    mtime: int
+    files: Dict[str, _File]
+    dirs: List[str]
+
+
+# Computes fingerprints of directory trees.
+#
+# Listing of a directory is cached along with its modification time. Directory modification time changes
+# only when its entries are added, removed or renamed (not when file contents are modified), so files
+# are stat'ed on every scan anyway, but unchanged directories are not listed again.
+#
+# In content mode files are compared by their digests, so that touching files without changing them
+# (e.g. by `git checkout`) does not change the fingerprint. Digests are recomputed only for files whose
+# modification time or size has changed.
+class Scanner:
+
+    def __init__(
+        self,
+        ignore: List[str] = DEFAULT_IGNORE,
+        content: bool = False,
+        cache_path: Optional[Path] = None,
+        workers: int = 8,
+    ) -> None:
+        self.ignore = ignore
+        self.content = content
+        self.cache_path = cache_path
+        self.workers = workers
+        self.dirs: Dict[str, _Dir] = {}
+        if self.cache_path is not None:
+            self.load()
+
+    def load(self) -> None:
+        assert self.cache_path is not None
+        try:
+            with open(self.cache_path, "r") as f:
+                data = json.load(f)
+            if data["version"] != _CACHE_VERSION or data["content"] != self.content:
+                return
+            self.dirs = {path: _Dir(int(d["mtime"]), d["files"], d["dirs"]) for path, d in data["dirs"].items()}
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Scan cache '{self.cache_path}' is corrupted, ignoring")
+
+    def store(self) -> None:
+        if self.cache_path is None:
+            return
+        data = {
+            "version": _CACHE_VERSION,
+            "content": self.content,
+            "dirs": {path: {"mtime": d.mtime, "files": d.files, "dirs": d.dirs} for path, d in self.dirs.items()},
+        }
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.cache_path.with_name(f"{self.cache_path.name}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        tmp_path.replace(self.cache_path)
+
+    def _ignored(self, name: str) -> bool:
+        return any([fnmatch.fnmatch(name, pattern) for pattern in self.ignore])
+
+    def _file(self, path: str, stat: os.stat_result, cached: Optional[_File]) -> _File:
+        if not self.content:
+            return [stat.st_mtime_ns, stat.st_size, None]
+        if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size and cached[2] is not None:
+            return cached
+        if os.path.islink(path):
+            value = os.readlink(path)
+        else:
+            value = file_digest(Path(path))
+        return [stat.st_mtime_ns, stat.st_size, value]
+
+    def _list(self, path: str) -> Tuple[List[str], List[str]]:
+        files, dirs = [], []
+        with os.scandir(path) as it:
+            for entry in it:
+                if self._ignored(entry.name):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.name)
+                else:
+                    files.append(entry.name)
+        return (files, dirs)
+
+    def _scan_dir(self, path: str, start_ns: int) -> Optional[_Dir]:
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            cached = self.dirs.get(path)
+            if cached is not None and cached.mtime == mtime and start_ns - mtime > _RACY_NS:
+                names, dirs = list(cached.files.keys()), cached.dirs
+            else:
+                names, dirs = self._list(path)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+        files: Dict[str, _File] = {}
+        for name in names:
+            file_path = os.path.join(path, name)
+            try:
+                stat = os.lstat(file_path)
+                files[name] = self._file(file_path, stat, cached.files.get(name) if cached is not None else None)
+            except FileNotFoundError:
+                continue
+        return _Dir(mtime, files, dirs)
+
+    # Returns fingerprints of all files in the tree by their paths relative to `path`.
+    def scan(self, path: Path) -> Dict[str, _File]:
+        start_ns = time.time_ns()
+        root = str(path)
+        try:
+            stat = os.lstat(root)
+        except FileNotFoundError:
+            return {}
+        if not os.path.isdir(root) or os.path.islink(root):
+            return {"": self._file(root, stat, None)}
+
+        result: Dict[str, _File] = {}
+        visited: Set[str] = set()
+        level = [root]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # Directories of the same depth are scanned in parallel
+            while len(level) > 0:
+                next_level = []
+                for dir_path, entry in zip(level, executor.map(lambda p: self._scan_dir(p, start_ns), level)):
+                    if entry is None:
+                        continue
+                    self.dirs[dir_path] = entry
+                    visited.add(dir_path)
+                    rel_dir = os.path.relpath(dir_path, root)
+                    for name, value in entry.files.items():
+                        result[os.path.normpath(os.path.join(rel_dir, name))] = value
+                    next_level.extend([os.path.join(dir_path, name) for name in entry.dirs])
+                level = next_level
+
+        # Forget removed directories
+        prefix = os.path.join(root, "")
+        for dir_path in [p for p in self.dirs.keys() if p.startswith(prefix) and p not in visited]:
+            del self.dirs[dir_path]
+
+        return result
+
+    def digest(self, path: Path) -> str:
+        if self.content:
+            # Modification time is not relevant
+            return digest(sorted([[name, value[2]] for name, value in self.scan(path).items()]))
+        return digest(sorted(self.scan(path).items()))
@@ -0,0 +1,135 @@
+from __future__ import annotations
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import os
+import fcntl
+import shutil
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Linux `ioctl` request to share file contents between files (copy-on-write), `_IOW(0x94, 9, int)`
+FICLONE = 0x40049409
+
+WORKERS = 8
+
+# The same as `ignore` argument of `shutil.copytree`
+IgnoreFn = Callable[[str, List[str]], Set[str]]
+
+# (source device, destination device) -> whether reflinks are supported
+_reflink_support: Dict[Tuple[int, int], bool] = {}
+
+
+def _reflink(src: Path, dst: Path) -> bool:
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        try:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        except OSError:
+            return False
+    return True
+
+
+# Places a copy of `src` file at `dst`.
+# Contents are shared (reflink) if the filesystem supports it, otherwise read-only files are hard-linked
+# (if `link` is set), and all other files are copied. Modification time is preserved in any case.
+def stage_file(src: Path, dst: Path, symlinks: bool = False, link: bool = True) -> None:
+    # Never write to existing file, it may be a hard link to another source
+    if dst.is_symlink() or dst.exists():
+        dst.unlink()
+
+    if symlinks and src.is_symlink():
+        os.symlink(os.readlink(src), dst)
+        return
+
+    stat = src.stat()
+    key = (stat.st_dev, dst.parent.stat().st_dev)
+    if _reflink_support.get(key, True):
+        if _reflink(src, dst):
+            _reflink_support[key] = True
+            shutil.copystat(src, dst)
+            return
+        if key not in _reflink_support:
+            logger.debug(f"reflinks are not supported for '{dst.parent}'")
+        _reflink_support[key] = False
+
+    if link and key[0] == key[1] and stat.st_mode & 0o222 == 0:
+        try:
+            dst.unlink(missing_ok=True)
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+
+    shutil.copy2(src, dst)
+
+
+# Stages files in parallel.
+def stage_files(pairs: List[Tuple[Path, Path]], symlinks: bool = False, link: bool = True, workers: int = WORKERS) -> None:
+    if len(pairs) == 0:
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Reraises the first error
+        list(executor.map(lambda p: stage_file(p[0], p[1], symlinks=symlinks, link=link), pairs))
+
+
+def _up_to_date(src: Path, dst: Path, symlinks: bool) -> bool:
+    try:
+        if symlinks and src.is_symlink():
+            return dst.is_symlink() and os.readlink(src) == os.readlink(dst)
+        src_stat, dst_stat = src.stat(), dst.lstat()
+    except FileNotFoundError:
+        return False
+    return not dst.is_symlink() and src_stat.st_size == dst_stat.st_size and src_stat.st_mtime_ns == dst_stat.st_mtime_ns
+
+
+# Removes entries of `root` that are not in `dirs` or `files` (or have another type).
+def _prune(root: Path, dirs: Set[Path], files: Set[Path]) -> None:
+    for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+        for name in [*filenames, *dirnames]:
+            path = Path(dirpath, name)
+            is_dir = path.is_dir() and not path.is_symlink()
+            if path in (dirs if is_dir else files):
+                continue
+            logger.debug(f"removing '{path}'")
+            if is_dir:
+                shutil.rmtree(path)
+            else:
+                path.unlink()
+
+
+# Replacement of `shutil.copytree(..., dirs_exist_ok=True)` that stages files using `stage_file`.
+# Files that have the same size and modification time in `dst` are skipped. Returns number of staged files.
+# If `prune` is set then entries of `dst` that are missing in `src` (or ignored) are removed.
+def stage_tree(
+    src: Path,
+    dst: Path,
+    ignore: Optional[IgnoreFn] = None,
+    symlinks: bool = False,
+    link: bool = True,
+    prune: bool = False,
+) -> int:
+    dirs: List[Path] = []
+    pairs: List[Tuple[Path, Path]] = []
+    for dirpath, dirnames, filenames in os.walk(src, followlinks=not symlinks):
+        ignored = ignore(dirpath, [*dirnames, *filenames]) if ignore is not None else set()
+        names = [name for name in filenames if name not in ignored]
+        if symlinks:
+            # Links to directories are staged as links
+            names.extend([name for name in dirnames if name not in ignored and os.path.islink(os.path.join(dirpath, name))])
+        dirnames[:] = [name for name in dirnames if name not in ignored and name not in names]
+
+        dst_dir = dst / Path(dirpath).relative_to(src)
+        dirs.append(dst_dir)
+        pairs.extend([(Path(dirpath, name), dst_dir / name) for name in names])
+
+    if prune and dst.is_dir():
+        _prune(dst, set(dirs), set([dst_path for _, dst_path in pairs]))
+    for dst_dir in dirs:
+        dst_dir.mkdir(parents=True, exist_ok=True)
+
+    pairs = [(src_path, dst_path) for src_path, dst_path in pairs if not _up_to_date(src_path, dst_path, symlinks)]
+    stage_files(pairs, symlinks=symlinks, link=link)
+    return len(pairs)